@@ -32,7 +32,6 @@ if current_dir not in sys.path:
 # --- END PATH FIX ---
 import argparse
 import core
-from annotator_gui import AnnotatorGUI
 
 def parse_args():
     """
@@ -65,7 +64,19 @@ def parse_args():
                         help="threads for use by the engine \
                              (default: %(default)s)",
                         type=int,
-                        default=8)
+                        default=core.default_engine_threads())
+    parser.add_argument("--hash", "-m",
+                        help="engine hash table size in MB per engine \
+                             (default: a quarter of the free memory, at most %d, shared by the engines)" % core.MAX_ENGINE_HASH_MB,
+                        type=int,
+                        default=None,
+                        metavar="MB")
+    parser.add_argument("--min-ply", "-p",
+                        help="don't analyse games with fewer than PLIES half-moves left after \
+                             the classified opening (default: %(default)s)",
+                        type=int,
+                        default=core.MIN_PLY_FOR_ANALYSIS,
+                        metavar="PLIES")
     parser.add_argument("--verbose", "-v", help="increase verbosity",
                         action="count")
     parser.add_argument("--outputfile", "-o",
@@ -97,11 +108,13 @@ def main():
 
     pgnfile = args.file
     if gui_mode: # Start the GUI if the flag is set
+        # Imported here so the command line path doesn't load Tk and the GUI modules
+        from annotator_gui import AnnotatorGUI
         # Pass the CLI arguments to the GUI to populate initial values
-        app = AnnotatorGUI(filter_str, engine_path, gametime)
+        app = AnnotatorGUI(filter_str, engine_path, gametime, threads)
         app.mainloop()
     else:
-        core.run_annotate(pgnfile, engine_path, gametime, threads, filter_str, outputfile)
+        core.run_annotate(pgnfile, engine_path, gametime, threads, filter_str, outputfile, args.hash, args.min_ply)
 
 
 if __name__ == "__main__":
@@ -2,21 +2,38 @@ import sys
 import os
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
 from typing import Iterator, List, Tuple, Dict, Any
 import io
-from collections import defaultdict
+from collections import deque
 import argparse
+import functools
 import json
 import logging
+import multiprocessing
 import chess
 import chess.pgn
 import chess.engine
 import chess.variant
 import json
 from pathlib import Path
-from core import logger, run_annotate, extract_filename_from_inputfile, _load_config, pgn_text_iterator
+from core import logger, run_annotate, extract_filename_from_inputfile, _load_config, pgn_headers_iterator, \
+    pgn_chunk_boundaries, GameTable, default_engine_threads, clamp_engine_threads, start_engine_session
 from statsview import PGNStatsView
+
+# Delay before the output path follows the input field, so it is not recomputed on every keystroke
+PGN_PATH_UPDATE_DELAY_MS = 150
+# The console is refreshed in batches: interval between flushes, messages per flush, and
+# the number of pending messages kept before the oldest ones are dropped
+CONSOLE_FLUSH_INTERVAL_MS = 50
+CONSOLE_FLUSH_BATCH = 500
+CONSOLE_MAX_PENDING = 10000
+# Interval at which the Tk main loop checks whether a running analysis has finished
+ANALYSIS_POLL_INTERVAL_MS = 100
+# Lines kept in the console; older output is removed so long runs don't slow the widget down
+CONSOLE_MAX_LINES = 5000
+# Smallest part of a PGN file that the statistics pass hands to a worker process of its own
+STATS_CHUNK_SIZE = 64 * 1024 * 1024
 # --- LOGGING AND STDOUT REDIRECTION CLASS ---
 
 class ConsoleRedirect(logging.Handler):
@@ -24,11 +41,15 @@ class ConsoleRedirect(logging.Handler):
     A custom logging handler and stdout 'file-like' object that redirects all
     output to a Tkinter Text widget in a thread-safe manner.
     """
-    def __init__(self, text_widget: tk.Text):
+    def __init__(self, text_widget: tk.Text, source=None):
         super().__init__()
         self.text_widget = text_widget
-        self.queue = []
-        self.running = True
+        # Optional multiprocessing queue with the output of the annotation worker process
+        self.source = source
+        # deque.append/popleft are thread-safe; maxlen drops the oldest messages on overflow
+        self.queue = deque(maxlen=CONSOLE_MAX_PENDING)
+        self.running = False
+        self._after_id = None
         # Formatter for log messages
         self.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
 
@@ -40,141 +61,194 @@ class ConsoleRedirect(logging.Handler):
 
     def write(self, s):
         """Called by print() (via sys.stdout)."""
-        # Add message to the queue. We do NOT update the widget directly.
+        # Add message to the queue. We do NOT touch Tk from the calling (worker) thread;
+        # the main loop picks the messages up in _flush_console.
         self.queue.append(s)
 
-        # Schedule the GUI update (thread-safe)
-        self.text_widget.after(0, self.process_queue)
-
     def flush(self):
         """Required for file-like objects, but does nothing here."""
         pass
 
-    def process_queue(self):
-        """Processes the message queue in the main Tkinter thread."""
-        while self.queue:
-            message = self.queue.pop(0)
-            self.text_widget.insert(tk.END, message)
+    def start(self):
+        """Starts the periodic flush on the Tkinter main loop."""
+        self.running = True
+        self._after_id = self.text_widget.after(CONSOLE_FLUSH_INTERVAL_MS, self._flush_console)
+
+    def stop(self):
+        """Stops the periodic flush and writes out whatever is still queued."""
+        self.running = False
+        if self._after_id is not None:
+            self.text_widget.after_cancel(self._after_id)
+            self._after_id = None
+        while self.queue or (self.source is not None and not self.source.empty()):
+            self.process_queue()
+
+    def process_queue(self, limit: int = CONSOLE_FLUSH_BATCH):
+        """Moves up to 'limit' queued messages into the Text widget with a single insert."""
+        if self.source is not None:
+            for _ in range(limit):
+                if self.source.empty():
+                    break
+                self.queue.append(self.source.get())
+        chunk = []
+        for _ in range(min(limit, len(self.queue))):
+            chunk.append(self.queue.popleft())
+        if chunk:
+            self.text_widget.insert(tk.END, ''.join(chunk))
+            lines = int(self.text_widget.index('end-1c').split('.')[0])
+            if lines > CONSOLE_MAX_LINES:
+                self.text_widget.delete('1.0', f'{lines - CONSOLE_MAX_LINES + 1}.0')
             self.text_widget.see(tk.END) # Auto-scrolls to the bottom
 
-def analyze_pgn_stats(input_file_path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]] | None:
-    """
-    Reads the PGN file and calculates statistics per Site and Event.
+    def _flush_console(self):
+        """Runs in the main Tkinter thread every CONSOLE_FLUSH_INTERVAL_MS."""
+        self._after_id = None
+        self.process_queue()
+        if self.running:
+            self._after_id = self.text_widget.after(CONSOLE_FLUSH_INTERVAL_MS, self._flush_console)
 
-    Returns the processed statistics as two dictionaries:
-    (stats_site, stats_event).
+class QueueWriter:
     """
-    stats_site = defaultdict(lambda: {'count': 0, 'total_elo': 0, 'player_count': 0})
-    stats_event = defaultdict(lambda: {'count': 0, 'total_elo': 0, 'player_count': 0})
-
-    # validate a file path
-    if not input_file_path or not os.path.exists(input_file_path):
-        logger.error(f"Error: Input file not found or not specified: {input_file_path}")
-        return None
-
-    try:
-        # File handling: Using a context manager for proper closing is best practice
-        logger.info(f"Starting PGN analysis of: {os.path.basename(input_file_path)}")
-
-        all_games = []
-
-
-        game_counter = 0
-        for item in pgn_text_iterator(input_file_path):
-            pgn_io = io.StringIO(item.strip())
-            try:
-                game = chess.pgn.read_game(pgn_io)
-            except Exception as e:
-                print(e)
-                print(item)
-                continue
-
-            game_data = {}
+    stdout 'file-like' object of the annotation worker process: every write is
+    sent to the GUI process, where ConsoleRedirect shows it in the console.
+    """
+    def __init__(self, output_queue):
+        self.output_queue = output_queue
 
-            game_data["White"]= game.headers.get("White","")
-            game_data["WhiteElo"] = game.headers.get("WhiteElo", "")
-            game_data["BlackElo"] = game.headers.get("BlackElo", "")
-            game_data["Black"]= game.headers.get("Black","")
-            game_data["Result"]= game.headers.get("Result","")
-            game_data["Date"]= game.headers.get("Date","")
-            game_data["Site"] = game.headers.get("Site", "")
-            game_data["Event"] = game.headers.get("Event", "")
-            all_games.append(game_data)
+    def write(self, s):
+        if s:
+            self.output_queue.put(s)
 
-            game_counter += 1
+    def flush(self):
+        pass
 
-            # 1. Retrieve Headers
-            site = game.headers.get("Site", "Onbekende Site")
-            event = game.headers.get("Event", "Onbekend Event")
 
-            white_elo_str = game.headers.get("WhiteElo", "0")
-            black_elo_str = game.headers.get("BlackElo", "0")
+def _init_annotate_worker(output_queue):
+    """
+    Initializer of the annotation worker process: routes print() and logging to
+    the GUI, and keeps the engine running between analyses.
+    """
+    sys.stdout = QueueWriter(output_queue)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    logging.getLogger().addHandler(handler)
+    start_engine_session()
 
-            # 2. Calculate Elo and Player Count
-            current_game_total_elo = 0
-            current_game_player_count = 0
+@functools.lru_cache(maxsize=None)
+def _parse_elo(rating: str) -> int | None:
+    """Elo header value as an int, or None if it is invalid. Ratings repeat a lot, hence the cache."""
+    # isdecimal() accepts exactly the digit strings int() can convert, without raising for "?" or ""
+    return int(rating) if rating.isdecimal() else None
 
-            try:
-                white_elo = int(white_elo_str)
-                current_game_total_elo += white_elo
-                current_game_player_count += 1
-            except ValueError:
-                pass # Ignore if Elo is invalid
 
-            try:
-                black_elo = int(black_elo_str)
-                current_game_total_elo += black_elo
-                current_game_player_count += 1
-            except ValueError:
-                pass
-
-            # If there is at least one valid rating, update the statistics
-            if current_game_player_count > 0:
-                stats_site[site]['count'] += 1
-                stats_site[site]['total_elo'] += current_game_total_elo
-                stats_site[site]['player_count'] += current_game_player_count
-
-                stats_event[event]['count'] += 1
-                stats_event[event]['total_elo'] += current_game_total_elo
-                stats_event[event]['player_count'] += current_game_player_count
-
-        logger.info(f"Total {game_counter} games read.")
-
-        # 3. Format the results and return them
-
-        # Function to convert the raw data to the Treeview structure
-        def format_stats(raw_stats: Dict[str, Any]) -> List[Dict[str, Any]]:
-            formatted = []
-            for name, data in raw_stats.items():
-                # Calculate Average Elo
-                avg_elo = data['total_elo'] / data['player_count'] if data['player_count'] > 0 else 0
-                formatted.append({
-                    "Naam": name,
-                    "Count": data['count'],
-                    "AvgElo": round(avg_elo)
-                })
-            return formatted
-
-        return format_stats(stats_site), format_stats(stats_event), all_games
-
-    except Exception as e:
-        logger.error(f"Unexpected error during PGN analysis: {e}")
-        # In case of errors, return an empty set to prevent the GUI from breaking
-        return None
+def _pgn_stats_chunk(input_file_path: str, start: int = 0, end: int | None = None):
+    """
+    Reads the games in a byte range of the PGN file (see pgn_chunk_boundaries)
+    and returns their raw statistics per Site and Event, plus the game list:
+    (stats_site, stats_event, all_games).
+    """
+    # Per name: [count, total_elo, player_count]. Plain dicts, as the result may have
+    # to be pickled back from a worker process
+    stats_site: Dict[str, List[int]] = {}
+    stats_event: Dict[str, List[int]] = {}
+    all_games = GameTable()
+    columns = all_games.columns
+    whites, blacks, results, dates = columns["White"], columns["Black"], columns["Result"], columns["Date"]
+    white_elos, black_elos, sites, events = columns["WhiteElo"], columns["BlackElo"], columns["Site"], columns["Event"]
+
+    # Only the headers are needed, so the movetext is never parsed; and only the
+    # tags of the game list, so the other tags are skipped
+    for headers in pgn_headers_iterator(input_file_path, start, end, GameTable.COLUMNS):
+        # Site/Event values repeat across many games: intern them, so the game list
+        # and both statistics dictionaries share one string object per name
+        site = sys.intern(headers.get("Site", "Onbekende Site"))
+        event = sys.intern(headers.get("Event", "Onbekend Event"))
+
+        # Each tag is looked up once, for both the game list and the statistics
+        white_elo_str = headers.get("WhiteElo")
+        black_elo_str = headers.get("BlackElo")
+
+        whites.append(headers.get("White", ""))
+        white_elos.append("" if white_elo_str is None else white_elo_str)
+        black_elos.append("" if black_elo_str is None else black_elo_str)
+        blacks.append(headers.get("Black", ""))
+        results.append(headers.get("Result", ""))
+        dates.append(headers.get("Date", ""))
+        sites.append(site)
+        events.append(event)
+
+        # 1. Parse the ratings (None if invalid; a missing rating counts as 0)
+        white_elo = 0 if white_elo_str is None else _parse_elo(white_elo_str)
+        black_elo = 0 if black_elo_str is None else _parse_elo(black_elo_str)
+
+        # 2. If there is at least one valid rating, update the statistics
+        if white_elo is not None or black_elo is not None:
+            current_game_total_elo = (white_elo or 0) + (black_elo or 0)
+            current_game_player_count = (white_elo is not None) + (black_elo is not None)
+
+            for stats, name in ((stats_site, site), (stats_event, event)):
+                totals = stats.get(name)
+                if totals is None:
+                    totals = stats[name] = [0, 0, 0]
+                totals[0] += 1
+                totals[1] += current_game_total_elo
+                totals[2] += current_game_player_count
+
+    return stats_site, stats_event, all_games
+
+
+def merge_pgn_stats(parts) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], GameTable]:
+    """
+    Combines the results of _pgn_stats_chunk for the chunks of a PGN file (in
+    file order) into the statistics per Site and Event, formatted for the
+    Treeview, plus the game list: (stats_site, stats_event, all_games).
+    """
+    # Merge the chunks in file order, so names keep the order of their first game
+    stats_site, stats_event, all_games = parts[0]
+    for part_site, part_event, part_games in parts[1:]:
+        for stats, part in ((stats_site, part_site), (stats_event, part_event)):
+            for name, (count, total_elo, player_count) in part.items():
+                totals = stats.setdefault(name, [0, 0, 0])
+                totals[0] += count
+                totals[1] += total_elo
+                totals[2] += player_count
+        all_games.extend(part_games)
+
+    # Function to convert the raw data to the Treeview structure
+    def format_stats(raw_stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Every stored name has at least one rated player, so player_count > 0
+        return [{"Naam": name, "Count": count, "AvgElo": round(total_elo / player_count)}
+                for name, (count, total_elo, player_count) in raw_stats.items()]
+
+    return format_stats(stats_site), format_stats(stats_event), all_games
 
 # ----------------------------------------------------------------------
 # TKINTER GUI CLASS
 # ----------------------------------------------------------------------
 
 class AnnotatorGUI(tk.Tk):
-    def __init__(self, initial_filter, initial_engine_path, initial_gametime):
+    def __init__(self, initial_filter, initial_engine_path, initial_gametime, initial_threads=None):
         super().__init__()
         self.title("Annotator Configuration")
         self.geometry("800x800")
 
-        # Ensure a single-threaded executor to prevent two analyses from running simultaneously
-        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Ensure a single worker to prevent two analyses from running simultaneously. The
+        # annotation runs in its own process, so its Python work does not compete with the
+        # Tk main loop for the GIL; its output comes back through worker_output.
+        mp_context = multiprocessing.get_context("spawn")
+        self.worker_output = mp_context.SimpleQueue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=mp_context,
+            initializer=_init_annotate_worker, initargs=(self.worker_output,)
+        )
         self.analysis_future = None
+        # The statistics pass has processes of its own, so it neither waits for nor
+        # holds up an annotation run. Large files are split into chunks (of at least
+        # STATS_CHUNK_SIZE bytes) that are read in parallel; see run_pgn_analysis.
+        self.stats_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=mp_context)
+        self.stats_futures = None
+        # Pending _poll_futures checks, per kind of task, so they can be cancelled on close
+        self._poll_after_ids: Dict[str, str] = {}
         self.original_stdout = sys.stdout
         self.console_handler = None
 
@@ -186,7 +260,7 @@ class AnnotatorGUI(tk.Tk):
         # The PGN directory is now composed based on the suffix in the JSON
         pgn_suffix = config_data.get("default_pgn_dir_suffix", "Schaken")
         self.default_pgn_dir = os.path.join(os.path.expanduser("~"), pgn_suffix)
-        print(f"Default PGN Directory: {self.default_pgn_dir}")
+        logger.debug(f"Default PGN Directory: {self.default_pgn_dir}")
 
         # The engine options are loaded from the JSON
         # The JSON structure (list of dicts) is converted to the Python structure (list of tuples)
@@ -196,9 +270,9 @@ class AnnotatorGUI(tk.Tk):
             for item in json_engine_options
         ]
 
-        print("\nLoaded Engine Options:")
+        logger.debug("Loaded Engine Options:")
         for name, path in self.engine_options:
-            print(f"- {name}: {path}")
+            logger.debug(f"- {name}: {path}")
 
         # --- The rest of the GUI initialization would go here ---
 
@@ -210,6 +284,9 @@ class AnnotatorGUI(tk.Tk):
 
         # 3. Only the display names for the Combobox
         self.default_engine_display_names: List[str] = [name for name, path in self.engine_options]
+        # The names shown in the engine Combobox: the defaults plus browsed paths. It holds
+        # the same names as engine_map, so membership is checked on the map
+        self._engine_display_names: List[str] = list(self.default_engine_display_names)
 
         # Initialize variables
         initial_inputfile = ""
@@ -219,7 +296,10 @@ class AnnotatorGUI(tk.Tk):
         self.pgn_var = tk.StringVar()
         self.filter_var = tk.StringVar(value=initial_filter)
         self.gametime_var = tk.StringVar(value=str(initial_gametime))
+        self.threads_var = tk.StringVar(value=str(initial_threads or default_engine_threads()))
         self._pgn_manually_set = False
+        self._pgn_after_id = None
+        self._last_inputfile = None
         self.update_pgn_path(initial_setup=True)
 
         # 4. Engine State Variables
@@ -273,27 +353,59 @@ class AnnotatorGUI(tk.Tk):
             # Optional: add the new option to the map and values
             if display_name not in self.engine_map:
                 self.engine_map[display_name] = engine_path
-                current_values = list(self.engine_combobox['values'])
-                if display_name not in current_values:
-                    current_values.append(display_name)
-                    self.engine_combobox['values'] = current_values
+                self._engine_display_names.append(display_name)
+                self.engine_combobox['values'] = self._engine_display_names
 
     # --- Application Logic ---
 
     def on_closing(self):
         """Stops the executor and closes the application."""
-        if self.analysis_future and self.analysis_future.running():
+        if self.analysis_future and not self.analysis_future.done():
             logger.warning("Task is being cancelled.")
             self.analysis_future.cancel()
-        self.executor.shutdown(wait=False)
+        for future in self.stats_futures or ():
+            future.cancel()
+        if self._pgn_after_id is not None:
+            self.after_cancel(self._pgn_after_id)
+        for after_id in self._poll_after_ids.values():
+            self.after_cancel(after_id)
+        self._poll_after_ids.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.stats_executor.shutdown(wait=False, cancel_futures=True)
         self.destroy()
 
     def update_pgn_path(self, *args, initial_setup=False):
-        if initial_setup or not self._pgn_manually_set:
-            current_inputfile = self.inputfile_var.get()
-            filename_base = extract_filename_from_inputfile(current_inputfile)
-            new_pgn_path = os.path.join(self.default_pgn_dir, f"{filename_base}-annotated.pgn")
-            self.pgn_var.set(new_pgn_path)
+        """
+        Trace callback of the input field. Derives the output path once typing
+        pauses for PGN_PATH_UPDATE_DELAY_MS, instead of on every keystroke.
+        """
+        if initial_setup:
+            self._do_update_pgn_path()
+            return
+
+        if self._pgn_after_id is not None:
+            self.after_cancel(self._pgn_after_id)
+        self._pgn_after_id = self.after(PGN_PATH_UPDATE_DELAY_MS, self._do_update_pgn_path)
+
+    def _do_update_pgn_path(self):
+        self._pgn_after_id = None
+        if self._pgn_manually_set:
+            return
+
+        current_inputfile = self.inputfile_var.get()
+        if current_inputfile == self._last_inputfile:
+            return
+        self._last_inputfile = current_inputfile
+
+        filename_base = extract_filename_from_inputfile(current_inputfile)
+        new_pgn_path = os.path.join(self.default_pgn_dir, f"{filename_base}-annotated.pgn")
+        self.pgn_var.set(new_pgn_path)
+
+    def _flush_pgn_path_update(self):
+        """Applies a pending (debounced) output path update right away."""
+        if self._pgn_after_id is not None:
+            self.after_cancel(self._pgn_after_id)
+            self._do_update_pgn_path()
 
     def set_pgn_manually_set(self, event):
         self._pgn_manually_set = True
@@ -311,12 +423,13 @@ class AnnotatorGUI(tk.Tk):
             self.pgn_var.set(filename)
 
     def run_annotate_start(self):
-        """Starts the engine analysis in a separate thread and redirects output."""
+        """Starts the engine analysis in the worker process and redirects output."""
 
-        if self.analysis_future and self.analysis_future.running():
+        if self.analysis_future and not self.analysis_future.done():
             self.status_var.set("Error: Analysis is already running.")
             return
 
+        self._flush_pgn_path_update()
         inputfile_arg = self.inputfile_var.get()
         outputfile_arg = self.pgn_var.get()
         filter_arg = self.filter_var.get()
@@ -337,48 +450,79 @@ class AnnotatorGUI(tk.Tk):
             self.status_var.set("Error: Analysis Time must be a valid number.")
             return
 
-        self.console_text.delete(1.0, tk.END)
-        self.redirect_output_start()
+        try:
+            threads_arg = clamp_engine_threads(int(self.threads_var.get()))
+        except ValueError:
+            self.status_var.set("Error: Engine Threads must be a whole number.")
+            return
+
+        self.console_start()
 
         self.status_var.set(f"Engine analysis started for {extract_filename_from_inputfile(inputfile_arg)}... (Running)")
         self.start_button.config(state=tk.DISABLED)
-        self.analyze_button.config(state=tk.DISABLED) # Disable Analysis button
 
         self.analysis_future = self.executor.submit(
-            run_annotate, inputfile_arg, engine_arg, gametime_arg, 8, filter_arg, outputfile_arg
+            run_annotate, inputfile_arg, engine_arg, gametime_arg, threads_arg, filter_arg, outputfile_arg
         )
-
-        self.after(100, lambda: self.check_analysis_status(outputfile_arg))
+        self._poll_futures("annotate", [self.analysis_future], self._on_analysis_done, outputfile_arg)
+
+    def _poll_futures(self, kind, futures, on_done, *args):
+        """
+        Calls on_done(futures, *args) on the Tkinter main loop once all futures
+        are done. They are polled: a done callback would run on the executor's
+        thread, and Tk must only be called from the main thread.
+        """
+        if all(future.done() for future in futures):
+            self._poll_after_ids.pop(kind, None)
+            on_done(futures, *args)
+        else:
+            self._poll_after_ids[kind] = self.after(ANALYSIS_POLL_INTERVAL_MS, self._poll_futures,
+                                                    kind, futures, on_done, *args)
 
     # --- FUNCTIONS FOR PGN ANALYSIS ---
 
     def run_pgn_analysis(self):
-        """Starts the PGN analysis (statistics) in a separate thread."""
+        """Starts the PGN analysis (statistics) in the statistics worker processes."""
 
-        if self.analysis_future and self.analysis_future.running():
-            self.status_var.set("Error: Analysis is already running.")
+        if self.stats_futures is not None:
+            self.status_var.set("Error: PGN analysis is already running.")
             return
 
         inputfile_arg = self.inputfile_var.get()
         if not inputfile_arg:
             self.status_var.set("Error: Select an Input File/URL first.")
             return
+        if not os.path.exists(inputfile_arg):
+            self.status_var.set(f"Error: Input file not found: {inputfile_arg}")
+            return
 
-        self.console_text.delete(1.0, tk.END)
-        self.redirect_output_start() # Ensures output goes to the console
+        self.console_start() # Ensures output goes to the console
 
         self.status_var.set(f"PGN analysis started for {extract_filename_from_inputfile(inputfile_arg)}... (Running)")
-
-        self.start_button.config(state=tk.DISABLED)
         self.analyze_button.config(state=tk.DISABLED)
+        logger.info(f"Starting PGN analysis of: {os.path.basename(inputfile_arg)}")
+
+        # The chunks are submitted as future tasks, so the GUI stays responsive while a
+        # large file is read; each chunk's results are pickled back to this process once
+        nchunks = min(os.cpu_count() or 1, os.path.getsize(inputfile_arg) // STATS_CHUNK_SIZE)
+        self.stats_futures = [self.stats_executor.submit(_pgn_stats_chunk, inputfile_arg, start, end)
+                              for start, end in pgn_chunk_boundaries(inputfile_arg, nchunks)]
+        self._poll_futures("stats", self.stats_futures, self._on_pgn_analysis_done, inputfile_arg)
 
-        # The analysis is submitted as a future task
-        # self.analysis_future = self.executor.submit(
-        #     analyze_pgn_stats, inputfile_arg
-        # )
 
-        # For synchronous execution in this example, call directly:
-        results = analyze_pgn_stats(inputfile_arg)
+    def _on_pgn_analysis_done(self, futures, inputfile_arg):
+        """Runs in the main Tkinter thread once all statistics chunks are complete."""
+        if futures is not self.stats_futures:
+            return
+        self.stats_futures = None
+
+        try:
+            results = merge_pgn_stats([future.result() for future in futures])
+            logger.info(f"Total {len(results[2])} games read.")
+        except Exception as e:
+            logger.error(f"Unexpected error during PGN analysis: {e}")
+            results = None
+        self.console_stop()
 
         if results:
             self.check_analysis_status_pgn(True)
@@ -395,11 +539,9 @@ class AnnotatorGUI(tk.Tk):
 
 
     def check_analysis_status_pgn(self, success):
-            self.start_button.config(state=tk.NORMAL)
             self.analyze_button.config(state=tk.NORMAL)
 
             try:
-                # success = self.analysis_future.result() # If future were used
                 if success:
                     self.status_var.set("✅ PGN Analysis completed. See Log for statistics.")
                 else:
@@ -407,18 +549,35 @@ class AnnotatorGUI(tk.Tk):
             except Exception as e:
                 self.status_var.set(f"❌ An unexpected error occurred: {e}")
             finally:
-                # self.analysis_future = None # If future were used
-                pass # Do nothing since we called directly
+                pass # The futures were already cleared by _on_pgn_analysis_done
     # --- END OF NEW FUNCTIONS FOR PGN ANALYSIS ---
 
 
+    def console_start(self):
+        """
+        Clears the console and redirects output to it, unless another task is
+        still running and writing there.
+        """
+        if self.analysis_future is None and self.stats_futures is None:
+            self.console_text.delete(1.0, tk.END)
+            self.redirect_output_start()
+
+
+    def console_stop(self):
+        """Restores the output once no task is running any more (see console_start)."""
+        if self.analysis_future is None and self.stats_futures is None:
+            self.redirect_output_stop()
+
+
     def redirect_output_start(self):
         """Redirects sys.stdout and the logging handlers to the Text widget."""
         # First remove any existing handlers to prevent duplication
         if self.console_handler:
+            self.console_handler.stop()
             logging.getLogger().removeHandler(self.console_handler)
 
-        self.console_handler = ConsoleRedirect(self.console_text)
+        self.console_handler = ConsoleRedirect(self.console_text, self.worker_output)
+        self.console_handler.start()
         sys.stdout = self.console_handler # Redirects print() calls
         logging.getLogger().addHandler(self.console_handler) # Redirects logger calls
 
@@ -427,39 +586,36 @@ class AnnotatorGUI(tk.Tk):
         """Restores sys.stdout and removes the custom logging handler."""
         sys.stdout = self.original_stdout
         if self.console_handler:
+            self.console_handler.stop()
             # We must remove the handler from the root logger
             logging.getLogger().removeHandler(self.console_handler)
             self.console_handler = None
 
 
-    def check_analysis_status(self, outputfile_arg):
-        """Checks if the annotation task in the separate thread is complete."""
-        if not self.analysis_future:
+    def _on_analysis_done(self, futures, outputfile_arg):
+        """Runs in the main Tkinter thread once the annotation task is complete."""
+        future, = futures
+        if future is not self.analysis_future:
             return
 
-        if self.analysis_future.running():
-            self.after(100, lambda: self.check_analysis_status(outputfile_arg))
-        else:
-            self.redirect_output_stop()
-            self.start_button.config(state=tk.NORMAL)
-            self.analyze_button.config(state=tk.NORMAL) # Re-enable Analysis button
+        self.analysis_future = None
+        self.console_stop()
+        self.start_button.config(state=tk.NORMAL)
 
-            try:
-                success = self.analysis_future.result()
-                if success:
-                    self.status_var.set(f"✅ Engine analysis complete. Games saved to {os.path.basename(outputfile_arg)}.")
-                else:
-                    self.status_var.set("❌ Engine analysis failed. See log for details.")
-            except Exception as e:
-                self.status_var.set(f"❌ An unexpected error occurred: {e}")
-            finally:
-                self.analysis_future = None
+        try:
+            success = future.result()
+            if success:
+                self.status_var.set(f"✅ Engine analysis complete. Games saved to {os.path.basename(outputfile_arg)}.")
+            else:
+                self.status_var.set("❌ Engine analysis failed. See log for details.")
+        except Exception as e:
+            self.status_var.set(f"❌ An unexpected error occurred: {e}")
 
 
     def create_widgets(self):
         # Configure the grid layout
         self.columnconfigure(1, weight=1)
-        self.rowconfigure(8, weight=1) # Now row 8 because of the extra button row
+        self.rowconfigure(9, weight=1) # Now row 9 because of the extra button and threads rows
 
         style = ttk.Style()
         style.configure("TLabel", padding=5, font=('Arial', 10))
@@ -498,7 +654,7 @@ class AnnotatorGUI(tk.Tk):
 
         self.engine_combobox = ttk.Combobox(self,
                                              textvariable=self.engine_var,
-                                             values=self.default_engine_display_names, # Use only the display names
+                                             values=self._engine_display_names, # Use only the display names
                                              width=80)
         self.engine_combobox.grid(row=row_index, column=1, sticky="ew", padx=10, pady=5)
 
@@ -514,6 +670,12 @@ class AnnotatorGUI(tk.Tk):
         gametime_entry.grid(row=row_index, column=1, sticky="w", padx=10, pady=5)
         row_index += 1
 
+        # 5b. ENGINE THREADS Entry (limited to the number of CPU cores)
+        ttk.Label(self, text="Engine Threads (-t):").grid(row=row_index, column=0, sticky="w", padx=10, pady=5)
+        threads_entry = ttk.Entry(self, textvariable=self.threads_var, width=10)
+        threads_entry.grid(row=row_index, column=1, sticky="w", padx=10, pady=5)
+        row_index += 1
+
         # 6. Start and Analysis Buttons (NEW ROW WITH TWO BUTTONS)
         button_frame = ttk.Frame(self)
         button_frame.grid(row=row_index, column=0, columnspan=3, sticky="ew", padx=10, pady=15)
@@ -1,16 +1,21 @@
  
 import sys
 import os
-import tkinter as tk
-from tkinter import filedialog, ttk, messagebox
 from concurrent.futures import ThreadPoolExecutor
-from typing import Iterator, List, Tuple, Dict, Any
+from typing import Iterable, Iterator, List, Tuple, Dict, Any
 import io
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import argparse
+import atexit
+import bisect
+import contextlib
 import json
+import functools
+import itertools
 import logging
 import math
+import mmap
+import re
 import chess
 import chess.pgn
 import chess.engine
@@ -39,6 +44,12 @@ NEEDS_ANNOTATION_THRESHOLD = 1.0
 MAX_SCORE = 10000
 MAX_CPL = 2000
 SHORT_PV_LEN = 10
+ANALYSIS_CACHE_SIZE = 4096
+PASS2_DEPTH_THRESHOLD = 18
+MIN_PLY_FOR_ANALYSIS = 0
+PASS2_DELTA_THRESHOLD = 150
+DEFAULT_ENGINE_HASH_MB = 256
+MAX_ENGINE_HASH_MB = 1024
 
 # Initialize Logging Module
 logger = logging.getLogger(__name__)
@@ -52,33 +63,36 @@ logger.setLevel(logging.INFO)
 BASE_DIR = Path(__file__).resolve().parent
 CONFIG_FILENAME = "settings/configuration.json"
 CONFIG_FILE_PATH = BASE_DIR / CONFIG_FILENAME
+@functools.lru_cache(maxsize=1)
 def _load_config() -> Dict[str, Any]:
     """
     Loads configuration from the JSON file.
     Provides robust error handling for missing files or invalid JSON.
+    The file is read once per process; callers must not modify the result.
     """
-    print(f"Attempting to load configuration from: {CONFIG_FILE_PATH}")
+    logger.debug(f"Attempting to load configuration from: {CONFIG_FILE_PATH}")
 
     if not CONFIG_FILE_PATH.exists():
-        print(f"Error: Configuration file not found at {CONFIG_FILE_PATH}. Using empty/default values.")
+        logger.error(f"Error: Configuration file not found at {CONFIG_FILE_PATH}. Using empty/default values.")
         # Return an empty dictionary to prevent the program from crashing
         return {}
 
     try:
         with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
             config = json.load(f)
-        print("Configuration successfully loaded.", config)
+        logger.debug(f"Configuration successfully loaded. {config}")
         return config
 
     except json.JSONDecodeError as e:
-        print(f"Error parsing JSON in {CONFIG_FILE_PATH}: {e}. Using empty/default values.")
+        logger.error(f"Error parsing JSON in {CONFIG_FILE_PATH}: {e}. Using empty/default values.")
         return {}
     except Exception as e:
-        print(f"Unexpected error loading configuration: {e}. Using empty/default values.")
+        logger.error(f"Unexpected error loading configuration: {e}. Using empty/default values.")
         return {}
 
 
 # Function to extract the filename from the URL/Path
+@functools.lru_cache(maxsize=128)
 def extract_filename_from_inputfile(input_path: str) -> str:
     """
     Extracts the filename (the last path segment) from a URL or local path.
@@ -87,10 +101,8 @@ def extract_filename_from_inputfile(input_path: str) -> str:
         if not input_path:
             return "default_game"
 
-        is_url = urlparse(input_path).scheme in ('http', 'https')
-
-        if is_url:
-            parsed_url = urlparse(input_path)
+        parsed_url = urlparse(input_path)
+        if parsed_url.scheme in ('http', 'https'):
             path = parsed_url.path
         else:
             path = input_path
@@ -110,129 +122,121 @@ def extract_filename_from_inputfile(input_path: str) -> str:
     except Exception:
         return "default_game"
 
-def matches_filter(game: chess.pgn.Game, filter_string: str) -> bool:
+# Filter keys that are matched exactly instead of as a substring
+EXACT_MATCH_KEYS = ('result', 'round', 'date', 'eco')
+
+
+# Filter keys that are matched against other header names than the key itself
+FILTER_KEY_HEADERS = {
+    'player': ("White", "Black"),
+    'title': ("WhiteTitle", "BlackTitle"),
+    'site': ("Site",),
+    'event': ("Event",),
+}
+
+
+def _filter_clause_cost(clause: Tuple[Tuple[str, ...], Tuple[str, ...], bool]) -> int:
     """
-    Checks if a game's metadata meets the filter criteria.
+    Relative cost of evaluating a filter clause: exact matches are cheapest,
+    then substring matches on one header, then Player/Title (two headers).
     """
-    if not filter_string or filter_string == "Geen":
-        return True
+    header_names, _, exact = clause
+    if exact:
+        return 0
+    return len(header_names)
 
-    # --- IMPLEMENTATION OF 'INTERESTING' FILTER ---
-    if filter_string == "Interesting":
-        # A game is considered "Interesting" if:
-        # 1. The result is not a draw.
-        # 2. AND (Both players >= HIGH_RATING) OR (A player with >= HIGH_RATING loses).
 
-        HIGH_RATING = 2650 # Threshold value for 'high rating'
+@functools.lru_cache(maxsize=32)
+def _parse_filter(filter_string: str) -> Tuple[Tuple[Tuple[str, ...], Tuple[str, ...], bool], ...]:
+    """
+    Splits a filter string (e.g. "Result:1-0,0-1;Player:Carlsen") into
+    (header names, lowercased values, exact match) clauses, ordered so the
+    cheapest clauses run first. All clauses must pass, so the order does not
+    change the outcome.
+    """
+    clauses = []
+    for filter_item in (f.strip() for f in filter_string.split(';')):
+        if not filter_item:
+            continue
+        if ':' not in filter_item:
+            print(f"Warning: Invalid filter format '{filter_item}'. Must be 'Key:Value'.")
+            continue
 
-        # 1. Check for Draw
-        result = game.headers.get("Result")
-        if result == "1/2-1/2" or result is None:
-            return False # Game is a draw or has no result
+        key, value_str = [p.strip() for p in filter_item.split(':', 1)]
+        values = tuple(v.strip().lower() for v in value_str.split(',') if v.strip())
+        header_names = FILTER_KEY_HEADERS.get(key.lower(), (key,))
+        exact = key.lower() in EXACT_MATCH_KEYS
+        clauses.append((header_names, values, exact))
 
-        # 2. Retrieve Ratings (safe parsing)
-        try:
-            white_rating = int(game.headers.get("WhiteElo", 0))
-        except ValueError:
-            white_rating = 0
+    clauses.sort(key=_filter_clause_cost)
+    return tuple(clauses)
 
-        try:
-            black_rating = int(game.headers.get("BlackElo", 0))
-        except ValueError:
-            black_rating = 0
 
-        # --- Rating Criteria Evaluation ---
+# Threshold value for 'high rating' in the 'Interesting' filter
+HIGH_RATING = 2650
 
-        is_high_rated_white = white_rating >= HIGH_RATING
-        is_high_rated_black = black_rating >= HIGH_RATING
 
-        # A. Condition met: two high-rated players?
-        if is_high_rated_white and is_high_rated_black:
-            return True
+def _elo(rating: str) -> int:
+    """Parses an Elo header value; missing or non-numeric ratings count as 0."""
+    return int(rating) if rating and rating.isdecimal() else 0
 
-        # B. Condition met: a high-rated player loses?
-        high_rated_lost = False
 
-        # White won (1-0), check if high-rated Black lost
-        if result == "1-0" and is_high_rated_black and not is_high_rated_white:
-            # Only interesting if high-rated Black loses to a lower rating
-            high_rated_lost = True
+def _is_interesting(headers) -> bool:
+    """
+    Implementation of the 'Interesting' filter. A game is considered "Interesting" if:
+    1. The result is not a draw.
+    2. AND (Both players >= HIGH_RATING) OR (A player with >= HIGH_RATING loses).
+    """
+    result = headers.get("Result")
+    if result is None or result == "1/2-1/2":
+        return False # Game is a draw or has no result
 
-        # Black won (0-1), check if high-rated White lost
-        elif result == "0-1" and is_high_rated_white and not is_high_rated_black:
-            # Only interesting if high-rated White loses to a lower rating
-            high_rated_lost = True
+    is_high_rated_white = _elo(headers.get("WhiteElo", "")) >= HIGH_RATING
+    is_high_rated_black = _elo(headers.get("BlackElo", "")) >= HIGH_RATING
 
-        if high_rated_lost:
-            return True
+    # A. Condition met: two high-rated players?
+    if is_high_rated_white and is_high_rated_black:
+        return True
 
-        # Does not meet the 'Interesting' criteria
-        return False
-    # --- END OF 'INTERESTING' FILTER ---
+    # B. Condition met: a high-rated player loses (to a lower rating, see A.)?
+    return ((result == "1-0" and is_high_rated_black) or
+            (result == "0-1" and is_high_rated_white))
 
-    filters = [f.strip() for f in filter_string.split(';') if f.strip()]
 
-    for filter_item in filters:
-        if ':' not in filter_item:
-            print(f"Warning: Invalid filter format '{filter_item}'. Must be 'Key:Value'.")
-            continue
+def matches_filter(game: chess.pgn.Game, filter_string: str) -> bool:
+    """
+    Checks if a game's metadata meets the filter criteria.
+    """
+    return matches_filter_headers(game.headers, filter_string)
 
-        key, value_str = [p.strip() for p in filter_item.split(':', 1)]
-        values = [v.strip() for v in value_str.split(',') if v.strip()]
 
-        passed_condition = False
+def matches_filter_headers(headers, filter_string: str) -> bool:
+    """
+    Checks if a game's headers (e.g. from chess.pgn.read_headers, so the
+    moves don't have to be parsed) meet the filter criteria.
+    """
+    if not filter_string or filter_string == "Geen":
+        return True
 
-        # 1. Special case: Player (searches in White AND Black)
-        if key.lower() == 'player':
-            for val in values:
-                white_player = game.headers.get("White", "")
-                black_player = game.headers.get("Black", "")
-                if val.lower() in white_player.lower() or val.lower() in black_player.lower():
-                    passed_condition = True
-                    break
+    if filter_string == "Interesting":
+        return _is_interesting(headers)
 
-        # 2. Special case: Title (searches in WhiteTitle AND BlackTitle)
-        elif key.lower() == 'title':
-            for val in values:
-                white_title = game.headers.get("WhiteTitle", "")
-                black_title = game.headers.get("BlackTitle", "")
-                if val.lower() in white_title.lower() or val.lower() in black_title.lower():
-                    passed_condition = True
-                    break
+    for header_names, values, exact in _parse_filter(filter_string):
+        # Player and Title search both players' headers; the values are already
+        # lowercased by _parse_filter, so only the header values are lowercased here
+        header_values = [headers.get(name, "").lower() for name in header_names]
 
-        elif key.lower() == 'site':
-            for val in values:
-                event_title = game.headers.get("Site", "")
-                if val.lower() in event_title.lower():
-                    passed_condition = True
-                    break
-        elif key.lower() == 'event':
-            for val in values:
-                event_title = game.headers.get("Event", "")
-                if val.lower() in event_title.lower():
-                    passed_condition = True
-                    break
-        # 3. General case: Standard header match (e.g., Event, Site, Result)
+        if exact:
+            passed_condition = any(value in values for value in header_values)
         else:
-            header_value = game.headers.get(key, "")
-
-            # Substring match
-            if key.lower() not in ['result', 'round', 'date', 'eco']:
-                for val in values:
-                    if val.lower() in header_value.lower():
-                        passed_condition = True
-                        break
-            # Exact match
-            else:
-                for val in values:
-                    if val.lower() == header_value.lower():
-                        passed_condition = True
-                        break
+            passed_condition = any(val in value for val in values for value in header_values)
 
         if not passed_condition:
             return False
 
     return True
+
+
 def setup_logging(args):
     """
     Sets logging module verbosity according to runtime arguments
@@ -279,31 +283,14 @@ def eval_numeric(result: chess.engine.AnalysisResult, board_turn: chess.Color) -
         The numeric evaluation in centipawns.
     """
 
-    # 1. Get the score.
     # We use .pov(board_turn) to always get the score from the perspective of the player to move.
-    score = result.get("score").pov(board_turn)
-
-    if score.is_mate():
-        dtm = score.mate()
-
-        if dtm > 0:
-            # Win in N moves (e.g., Mate in 3): the smaller N, the higher the score.
-            # (MAX_CP_SCORE - 1) is better than 10000 CP.
-            return MAX_CP_SCORE - abs(dtm)
-        elif dtm < 0:
-            # Loss in N moves (e.g., Mated in 3): the smaller N, the lower the score.
-            # (-MAX_CP_SCORE - 1) is worse than -10000 CP.
-            return -(MAX_CP_SCORE - abs(dtm))
-        else:
-            # Should not happen unless Mate is already achieved, but for safety.
-            return 0
-
-    elif score.cp is not None:
-        # If we have a normal centipawn score (no DTM), return it.
-        return score.cp
-
-    # Handling for unexpected cases (e.g., engine provides no score)
-    raise RuntimeError("Engine evaluation result was unintelligible or missing score.")
+    # Score.score(mate_score=...) maps Mate in N to MAX_CP_SCORE - N (and mated in N to
+    # -(MAX_CP_SCORE - N)), so no separate mate/centipawn dispatch is needed.
+    score = result["score"].pov(board_turn).score(mate_score=MAX_CP_SCORE)
+    if score is None:
+        # Handling for unexpected cases (e.g., engine provides no score)
+        raise RuntimeError("Engine evaluation result was unintelligible or missing score.")
+    return score
 
 def eval_human(white_to_move: chess.Color, result: chess.engine.AnalysisResult) -> str:
     """
@@ -356,8 +343,7 @@ def eval_human(white_to_move: chess.Color, result: chess.engine.AnalysisResult)
         # so we only need to format).
 
         # Add the + sign for a clear display of advantage for White
-        format_string = '{:+.2f}'
-        return format_string.format(score_in_pawns)
+        return f"{score_in_pawns:+.2f}"
 
     # If the engine returns a result without a score
     raise RuntimeError("Engine evaluation result was unintelligible or missing score.")
@@ -372,6 +358,7 @@ def eval_absolute(number, white_to_move):
     return number if white_to_move else -number
 
 
+@functools.lru_cache(maxsize=8192)
 def winning_chances(centipawns):
     """
     Takes an evaluation in centipawns and returns an integer value estimating
@@ -382,29 +369,75 @@ def winning_chances(centipawns):
     return 50 + 50 * (2 / (1 + math.exp(-0.004 * centipawns)) - 1)
 
 
+def has_evals(judgment):
+    """
+    Returns True if judgment is a judge_move() result with both evaluations.
+    Between the passes node comments hold judgments, but they can also hold
+    plain strings (engine errors, the opening classification), which must not
+    be searched for "besteval" character by character.
+    """
+    return isinstance(judgment, dict) and "besteval" in judgment and "playedeval" in judgment
+
+
 def needs_annotation(judgment):
     """
     Returns a boolean indicating whether a node with the given evaluations
     should have an annotation added
     """
-    if not (judgment and "besteval" in judgment and "playedeval" in judgment):
+    if not has_evals(judgment):
         return False
-    best = winning_chances(int(judgment["besteval"]))
-    played = winning_chances(int(judgment["playedeval"]))
+    besteval = int(judgment["besteval"])
+    playedeval = int(judgment["playedeval"])
+    # Most moves are the engine's choice or evaluate the same: no difference at all
+    if besteval == playedeval:
+        return False
+    best = winning_chances(besteval)
+    played = winning_chances(playedeval)
     delta = abs(best - played)
 
     # NOTE: Assuming NEEDS_ANNOTATION_THRESHOLD is defined elsewhere (e.g., 10)
     return delta > NEEDS_ANNOTATION_THRESHOLD or best > played
 
 
+def is_settled(judgment):
+    """
+    Returns a boolean indicating whether a first-pass judgment is deep and
+    clear-cut enough that a second-pass analysis would not change it
+    """
+    if not has_evals(judgment) or (judgment.get("depth") or 0) < PASS2_DEPTH_THRESHOLD:
+        return False
+    return abs(judgment["besteval"] - judgment["playedeval"]) >= PASS2_DELTA_THRESHOLD
+
+
+# LRU cache of first-pass analysis results, see judge_move(). It is cleared whenever
+# an engine is (re)started, as the new engine may be set up differently.
+_analysis_cache: "OrderedDict[tuple, chess.engine.InfoDict]" = OrderedDict()
+
+
 async def judge_move(board: chess.Board, played_move: chess.Move, engine: chess.engine.UciProtocol, searchtime_s: float):
     """
     Evaluate the strength of a given move by comparing it to engine's best
     move and evaluation at a given depth, in a given board context.
+    No game identity is passed to engine.analyse, so python-chess only sends
+    ucinewgame on an engine's first command and its hash stays warm for the
+    whole run.
 
     Returns a judgment dictionary.
     """
 
+    # A forced move needs no engine at all: there is nothing to compare it with.
+    if board.legal_moves.count() == 1:
+        return {
+            "bestmove": played_move,
+            "besteval": 0,
+            "playedeval": 0,
+            "pv": [played_move],
+            "depth": 0,
+            "nodes": 0,
+            "bestcomment": "Forced",
+            "playedcomment": "Forced",
+        }
+
     # The engine.analyse() method automatically sets the FEN via the 'board' argument.
     analysis_limit = chess.engine.Limit(time=searchtime_s / 2)
     judgment = {}
@@ -415,16 +448,34 @@ async def judge_move(board: chess.Board, played_move: chess.Move, engine: chess.
 
     # First analysis: Determine the best move and the evaluation before the played move
     # =========================================================================
-    try:
-        # The 'board' parameter ensures the engine is synchronized
-        best_move_result = await engine.analyse(
-            board,
-            limit=analysis_limit,
-            info=chess.engine.Info(chess.engine.Info.ALL) # Request all info
-        )
-    except chess.engine.EngineTerminatedError:
-        # Error handling for if the engine suddenly stops
-        return {"error": "Engine terminated during analysis"}
+    # Transpositions (within a game or across games) reuse an earlier search of the same
+    # position, provided it was made by the same engine with the same time budget. The
+    # key leaves out the move counters (epd instead of fen), so other move orders and
+    # move numbers hit too. A position that already occurred in the game is searched
+    # afresh: the engine's evaluation can depend on that history.
+    if board.is_repetition(2):
+        cache_key = None
+        best_move_result = None
+    else:
+        cache_key = (engine.id.get("name"), board.epd(), searchtime_s)
+        best_move_result = _analysis_cache.get(cache_key)
+    if best_move_result is not None:
+        _analysis_cache.move_to_end(cache_key)
+    else:
+        try:
+            # The 'board' parameter ensures the engine is synchronized
+            best_move_result = await engine.analyse(
+                board,
+                limit=analysis_limit,
+                info=chess.engine.Info(chess.engine.Info.ALL) # Request all info
+            )
+        except chess.engine.EngineTerminatedError:
+            # Error handling for if the engine suddenly stops
+            return {"error": "Engine terminated during analysis"}
+        if cache_key is not None and best_move_result.get("pv"):
+            _analysis_cache[cache_key] = best_move_result
+            if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+                _analysis_cache.popitem(last=False)
 
     # Validate that the engine found a move and a score
     if not best_move_result.get("pv"):
@@ -447,8 +498,10 @@ async def judge_move(board: chess.Board, played_move: chess.Move, engine: chess.
     if played_move == judgment["bestmove"]:
         judgment["playedeval"] = judgment["besteval"]
     else:
-        # Make a copy of the board and play the move
-        temp_board = board.copy()
+        # Make a copy of the board and play the move. Only the moves since the last
+        # capture or pawn move are kept: that is all the history the engine needs
+        # for repetition detection
+        temp_board = board.copy(stack=board.halfmove_clock)
         temp_board.push(played_move)
 
         # Perform the analysis on the NEW position (after the played move)
@@ -469,29 +522,34 @@ async def judge_move(board: chess.Board, played_move: chess.Move, engine: chess.
     return judgment
 
 
+# get_nags lookup table: the NAG for delta = playedeval - besteval is
+# NAG_TABLE[bisect_right(NAG_THRESHOLDS, delta)]. A delta below a threshold selects
+# the entry on its left; nextafter turns the "better than" tests into the same form.
+NAG_THRESHOLDS = (
+    ERROR_THRESHOLD['BLUNDER'],
+    ERROR_THRESHOLD['MISTAKE'],
+    ERROR_THRESHOLD['DUBIOUS'],
+    math.nextafter(0, math.inf),
+    math.nextafter(0.5, math.inf),
+)
+NAG_TABLE = (
+    [chess.pgn.NAG_BLUNDER],
+    [chess.pgn.NAG_MISTAKE],
+    [chess.pgn.NAG_DUBIOUS_MOVE],
+    [],
+    [7],
+    [9],
+)
+
+
 def get_nags(judgment):
     """
     Returns a Numeric Annotation Glyph (NAG) according to how much worse the
     played move was vs the best move
     """
-    # NOTE: Assuming ERROR_THRESHOLD is defined elsewhere
-    if "besteval" in judgment and "playedeval" in judgment:
+    if has_evals(judgment):
         delta = judgment["playedeval"] - judgment["besteval"]
-
-        if delta < ERROR_THRESHOLD["BLUNDER"]:
-            #print("blunder:", chess.pgn.NAG_BLUNDER)
-            return [chess.pgn.NAG_BLUNDER]
-        elif delta < ERROR_THRESHOLD["MISTAKE"]:
-            #print("MISTAKE:", chess.pgn.NAG_MISTAKE)
-            return [chess.pgn.NAG_MISTAKE]
-        elif delta < ERROR_THRESHOLD["DUBIOUS"]:
-            return [chess.pgn.NAG_DUBIOUS_MOVE]
-        elif judgment["playedeval"] > judgment["besteval"]+0.5:
-            return [9]
-        elif judgment["playedeval"] > judgment["besteval"]:
-            return [7]
-        else:
-            return []
+        return list(NAG_TABLE[bisect.bisect_right(NAG_THRESHOLDS, delta)])
     else:
        return []
 
@@ -525,24 +583,32 @@ def truncate_pv(board, pv):
     """
     # NOTE: Assuming SHORT_PV_LEN is defined elsewhere (e.g., 10)
 
-    # We need a copy of the board to check for game end without modifying the original
-    temp_board = board.copy()
+    # The pv is played out on the board itself and taken back afterwards, which
+    # is cheaper than copying the board. The engine's PV is legal, so the moves
+    # are pushed without checking them.
     for move in pv:
-        if not temp_board.is_legal(move):
-            raise AssertionError
-        temp_board.push(move)
+        board.push(move)
+    try:
+        game_over = board.is_game_over(claim_draw=True)
+    finally:
+        for _ in pv:
+            board.pop()
 
-    if temp_board.is_game_over(claim_draw=True):
+    if game_over:
         return pv
     else:
         return pv[:SHORT_PV_LEN]
 
 
-def add_annotation(node, judgment):
+def add_annotation(node, judgment, board=None):
     """
-    Add evaluations and the engine's primary variation as annotations to a node
+    Add evaluations and the engine's primary variation as annotations to a node.
+    'board' is the position before the move, if the caller already has it
+    (prev_node.board() replays the game from the root).
     """
     prev_node = node.parent
+    if board is None:
+        board = prev_node.board()
 
     # Add the engine evaluation
     if judgment["bestmove"] != node.move:
@@ -550,24 +616,37 @@ def add_annotation(node, judgment):
 
     # Get the engine primary variation
     # The board is passed to truncate_pv to correctly check for game end
-    variation = truncate_pv(prev_node.board().copy(), judgment["pv"])
+    variation = truncate_pv(board, judgment["pv"])
 
     # Add the engine's primary variation as an annotation
-    prev_node.add_line(moves=variation)
+    line_end = prev_node.add_line(moves=variation)
 
     # Add a comment to the end of the variation explaining the game state
     var_end_node = prev_node.variation(judgment["pv"][0]).end()
-    var_end_node.comment = var_end_comment(var_end_node.board(), judgment)
+    if var_end_node is line_end:
+        # The position at the end of the new line follows from 'board', by
+        # playing the variation on it and taking it back as in truncate_pv
+        for move in variation:
+            board.push(move)
+        try:
+            var_end_node.comment = var_end_comment(board, judgment)
+        finally:
+            for _ in variation:
+                board.pop()
+    else:
+        # The played move was the engine's first choice: the line ends where the game does
+        var_end_node.comment = var_end_comment(var_end_node.board(), judgment)
 
     # Add a Numeric Annotation Glyph (NAG) according to how weak the played
     # move was
     node.nags = get_nags(judgment)
 
 
-def classify_fen(fen, ecodb):
+def classify_fen(key, ecodb):
     """
-    Searches a JSON file with Encyclopedia of Chess Openings (ECO) data to
-    check if the given FEN matches an existing opening record
+    Looks up the given position key (see eco_key) in an index of Encyclopedia of
+    Chess Openings (ECO) data (see build_eco_index) to check if it matches an
+    existing opening record
 
     Returns a classification
 
@@ -581,43 +660,69 @@ def classify_fen(fen, ecodb):
     classification["desc"] = ""
     classification["path"] = ""
 
-    for opening in ecodb:
-        if opening['f'] == fen:
-            classification["code"] = opening['c']
-            classification["desc"] = opening['n']
-            classification["path"] = opening['m']
-            break # Optimization: stop once a match is found
+    opening = ecodb.get(key)
+    if opening is not None:
+        classification["code"] = opening['c']
+        classification["desc"] = opening['n']
+        classification["path"] = opening['m']
 
     return classification
 
 
+def build_eco_index(ecodata):
+    """
+    Takes the list of opening records from eco.json and returns a dictionary
+    eco_key -> record, so classify_fen is a hash lookup instead of a scan.
+    If a position occurs more than once, the first record wins.
+    """
+    eco_index = {}
+    for opening in ecodata:
+        # The eco.json FENs only hold placement, side to move and castling rights
+        eco_index.setdefault(eco_key(chess.Board(opening['f'])), opening)
+    return eco_index
+
+
 def eco_fen(board):
     """
     Takes a board position and returns a FEN string formatted for matching with
     eco.json
     """
-    board_fen = board.board_fen()
-    castling_fen = board.castling_xfen()
+    return f"{board.board_fen()} {'w' if board.turn else 'b'} {board.castling_xfen()}"
 
-    to_move = 'w' if board.turn else 'b'
 
-    return "{} {} {}".format(board_fen, to_move, castling_fen)
+def eco_key(board):
+    """
+    Takes a board position and returns a hashable key for matching with
+    eco.json: the same information as eco_fen (placement, side to move and
+    castling rights), taken straight from the bitboards instead of formatted
+    as a string
+    """
+    return (board.pawns, board.knights, board.bishops, board.rooks,
+            board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK],
+            board.turn, board.clean_castling_rights())
 
 
 def debug_print(node, judgment):
     """
     Prints some debugging info about a position that was just analyzed
     """
+    # The board and SAN work below is only done when it will actually be logged
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    board = node.board()
+    parent_board = node.parent.board()
     # NOTE: Assuming 'logger' is defined elsewhere, the strings are translated.
-    logger.debug(node.board())
-    logger.debug(node.board().fen())
-    logger.debug("Played move: %s", format(node.parent.board().san(node.move)))
+    logger.debug(board)
+    logger.debug(board.fen())
+    logger.debug("Played move: %s", format(parent_board.san(node.move)))
     logger.debug("Best move: %s",
-                 format(node.parent.board().san(judgment["bestmove"])))
+                 format(parent_board.san(judgment["bestmove"])))
     logger.debug("Best eval: %s", format(judgment["besteval"]))
     logger.debug("Best comment: %s", format(judgment["bestcomment"]))
     logger.debug("PV: %s",
-                 format(node.parent.board().variation_san(judgment["pv"])))
+                 format(parent_board.variation_san(judgment["pv"])))
     logger.debug("Played eval: %s", format(judgment["playedeval"]))
     logger.debug("Played comment: %s", format(judgment["playedcomment"]))
     logger.debug("Delta: %s",
@@ -628,26 +733,15 @@ def debug_print(node, judgment):
     logger.debug("")
 
 
-def cpl(string):
-    """
-    Centipawn Loss
-    Takes a string and returns an integer representing centipawn loss of the
-    move. We put a ceiling on this value so that big blunders don't skew the
-    acpl too much
-    """
-    # NOTE: Assuming MAX_CPL is defined elsewhere (e.g., 500)
-    cpl = int(string)
-
-    return min(cpl, MAX_CPL)
-
-
 def acpl(cpl_list):
     """
     Average Centipawn Loss
-    Takes a list of integers and returns an average of the list contents
+    Takes a list of centipawn losses and returns their average. Each loss is
+    capped at MAX_CPL so that big blunders don't skew the acpl too much
     """
     try:
-        return sum(cpl_list) / len(cpl_list)
+        # map(min, ...) caps all losses without a Python-level call per move
+        return sum(map(min, cpl_list, itertools.repeat(MAX_CPL))) / len(cpl_list)
     except ZeroDivisionError:
         return 0
 
@@ -656,23 +750,15 @@ def clean_game(game):
     Takes a game and strips all comments and variations, returning the
     "cleaned" game
     """
-    node = game.end()
-
-    while True:
-        prev_node = node.parent
-
+    root = game.root()
+    for node in itertools.chain((root,), root.mainline()):
         node.comment = None
         node.nags = []
-        for variation in reversed(node.variations):
-            if not variation.is_main_variation():
-                node.remove_variation(variation)
-
-        if node == game.root():
-            break
+        # The main variation is always the first one, so the sidelines are simply
+        # cut off the list instead of being searched for one at a time
+        del node.variations[1:]
 
-        node = prev_node
-
-    return node.root()
+    return root
 
 
 def game_length(game):
@@ -680,14 +766,19 @@ def game_length(game):
     Takes a game and returns an integer corresponding to the number of
     half-moves in the game
     """
-    ply_count = 0
-    node = game.end()
+    return sum(1 for _ in game.mainline())
 
-    while not node == game.root():
-        node = node.parent
-        ply_count += 1
 
-    return ply_count
+@functools.lru_cache(maxsize=1)
+def _load_eco():
+    """
+    Reads eco/eco.json once per process and returns the list of opening
+    records together with its FEN index (see build_eco_index)
+    """
+    ecopath = os.path.join(os.path.dirname(__file__), 'eco/eco.json')
+    with open(ecopath, 'r') as ecofile:
+        ecodata = json.load(ecofile)
+    return ecodata, build_eco_index(ecodata)
 
 
 def classify_opening(game):
@@ -696,52 +787,50 @@ def classify_opening(game):
     Returns the classified game and root_node, which is the node where the
     classification was made
     """
-    ecopath = os.path.join(os.path.dirname(__file__), 'eco/eco.json')
-    with open(ecopath, 'r') as ecofile:
-        ecodata = json.load(ecofile)
-
-        ply_count = 0
-
-        root_node = game.root()
-        node = game.end()
-
-        # Opening classification for variant games is not implemented (yet?)
-        is_960 = root_node.board().chess960
-        if is_960:
-            variant = "chess960"
-        else:
-            variant = type(node.board()).uci_variant
-
-        if variant != "chess":
-            logger.info("Skipping opening classification in variant "
-                        "game: {}".format(variant))
-            return node.root(), root_node, game_length(game)
-
-        logger.info("Classifying the opening for non-variant {} "
-                    "game...".format(variant))
-
-        while not node == game.root():
-            prev_node = node.parent
-
-            fen = eco_fen(node.board())
-            classification = classify_fen(fen, ecodata)
-
-            if classification["code"] != "":
-                # Add some comments classifying the opening
-                node.root().headers["ECO"] = classification["code"]
-                node.root().headers["Opening"] = classification["desc"]
-                node.comment = "{} {}".format(classification["code"],
-                                              classification["desc"])
-                # Remember this position so we don't analyze the moves
-                # preceding it later
-                root_node = node
-                # Break (don't classify previous positions)
-                break
+    ecodata, eco_index = _load_eco()
 
-            ply_count += 1
-            node = prev_node
+    root_node = game.root()
+    board = root_node.board()
 
-        return node.root(), root_node, ply_count
+    # Opening classification for variant games is not implemented (yet?)
+    is_960 = board.chess960
+    if is_960:
+        variant = "chess960"
+    else:
+        variant = type(board).uci_variant
+
+    if variant != "chess":
+        logger.info("Skipping opening classification in variant "
+                    "game: {}".format(variant))
+        return root_node, root_node, game_length(game)
+
+    logger.info("Classifying the opening for non-variant {} "
+                "game...".format(variant))
+
+    # Walk forward with one incrementally updated board (node.board() replays the
+    # game from the root on every call) and remember the deepest classified position
+    classified_node = None
+    classified_ply = 0
+    ply = 0
+    for node in root_node.mainline():
+        board.push(node.move)
+        ply += 1
+        classification = classify_fen(eco_key(board), eco_index)
+        if classification["code"] != "":
+            classified_node, classified_ply = node, ply
+            opening = classification
+
+    if classified_node is None:
+        return root_node, root_node, ply
+
+    # Add some comments classifying the opening
+    root_node.headers["ECO"] = opening["code"]
+    root_node.headers["Opening"] = opening["desc"]
+    classified_node.comment = "{} {}".format(opening["code"], opening["desc"])
+
+    # Return this position as the new root, so we don't analyze the moves
+    # preceding it later, and the number of plies after it
+    return root_node, classified_node, ply - classified_ply
 
 
 def add_acpl(game, root_node):
@@ -753,25 +842,26 @@ def add_acpl(game, root_node):
     white_cpl = []
     black_cpl = []
 
-    node = game.end()
-    while not node == root_node:
-        prev_node = node.parent
-
+    # The side to move alternates along the mainline, so no board has to be
+    # built at all: root_node.turn() only counts the plies up to the root
+    turn = root_node.turn()
+    for node in root_node.mainline():
         judgment = node.comment
-        if judgment and "besteval" in judgment and "playedeval" in judgment:
+        if has_evals(judgment):
             delta = judgment["besteval"] - judgment["playedeval"]
 
-            if node.board().turn:
-                black_cpl.append(cpl(delta))
+            if turn:
+                white_cpl.append(delta)
             else:
-                white_cpl.append(cpl(delta))
+                black_cpl.append(delta)
 
-        node = prev_node
+        turn = not turn
 
-    node.root().headers["WhiteACPL"] = str(round(acpl(white_cpl)))
-    node.root().headers["BlackACPL"] = str(round(acpl(black_cpl)))
+    root = root_node.root()
+    root.headers["WhiteACPL"] = str(round(acpl(white_cpl)))
+    root.headers["BlackACPL"] = str(round(acpl(black_cpl)))
 
-    return node.root()
+    return root
 
 
 def get_total_budget(arg_gametime):
@@ -789,16 +879,23 @@ def get_pass2_budget(total_budget, pass1_budget):
 def get_time_per_move(pass_budget, ply_count):
     try:
         count_ = float(pass_budget) / float(ply_count)
-    except:
+    except (ZeroDivisionError, ValueError, TypeError):
         count_ = 60
     return count_
 
 
-async def analyze_game(game, arg_gametime, engine, threads):
+async def analyze_game(game, arg_gametime, engine, threads, min_ply=MIN_PLY_FOR_ANALYSIS, engine_name=None):
     """
     Take a PGN game and return a GameNode with engine analysis added
     ...
+    Games with fewer than min_ply half-moves left after the classified opening
+    (the last position found in the ECO book) are not analysed; they only get
+    the opening classification and the annotator headers, no ACPL headers.
+    engine_name (see get_engine_name) is looked up from the engine if the
+    caller didn't already do so.
     """
+    if engine_name is None:
+        engine_name = get_engine_name(engine)
 
     # First, check the game for PGN parsing errors
     if not checkgame(game):
@@ -807,16 +904,17 @@ async def analyze_game(game, arg_gametime, engine, threads):
 
     # ... (rest of the initialization logic) ...
 
-    # Start keeping track of the root node
-    root_node = game.end()
-    node = root_node
-
     # Clear existing comments and variations
     game = clean_game(game)
 
     # Attempt to classify the opening and calculate the game length
     game, root_node, ply_count = classify_opening(game)
 
+    if ply_count < min_ply:
+        # Nothing was judged, so no ACPL headers: an ACPL of 0 would read as perfect play
+        logger.info("Game too short (%i plies after the opening), skipping the analysis", ply_count)
+        return finish_game(root_node, engine_name)
+
     ###########################################################################
     # Perform game analysis (Pass 1)
     ###########################################################################
@@ -828,48 +926,71 @@ async def analyze_game(game, arg_gametime, engine, threads):
     logger.debug("Pass 1 budget is %i seconds, with %f seconds per move",
                  pass1_budget, time_per_move)
     logger.info("Performing first pass...")
-    try:
-        error_count = 0
-        node = game.end()
-        while not node == root_node:
-            prev_node = node.parent
-
-            try:
-                # CHANGE 6: judge_move must now use AWAIT and info_handler REMOVED
-                judgment = await judge_move(prev_node.board(), node.move, engine, time_per_move)
-
-                # Record the delta, to be referenced in the second pass
-                node.comment = judgment
 
-                # Count the number of mistakes that will have to be annotated later
-                if needs_annotation(judgment):
-                    error_count += 1
+    # A single engine cancels its running search when it gets a new command, so the
+    # concurrent judgments below must always go through an EnginePool
+    if not isinstance(engine, EnginePool):
+        engine = EnginePool([engine])
 
-                # Print some debugging info
-                debug_print(node, judgment)
-            except chess.engine.EngineError as e:
-                # Log the error cleanly in your own application.
-                move_uci = node.move.uci()
-                board_fen = prev_node.board().fen()
-                logger.warning(f"EngineError for move {move_uci} on FEN {board_fen}. Error: {e}")
+    # The engines' hash is never cleared between games (see judge_move): games and
+    # both passes share it, whichever engine of the pool a position lands on
 
-                # You can decide here whether to skip the move (as done with 'pass'),
-                # or assign a default 'judgment'.
-                node.comment = "Skipped due to engine error."
+    # The board before every move, built in one forward pass (node.board() replays the
+    # game from the root on every call). Each copy keeps the moves since the last capture
+    # or pawn move: all the history the engine needs for repetition detection
+    boards = {}
+    board = game.board()
+    for node in game.mainline():
+        boards[node] = board.copy(stack=board.halfmove_clock)
+        board.push(node.move)
 
-            except Exception as e:
-                # Catch other unexpected errors that do not originate from the engine
-                logger.error(f"Unexpected error during analysis: {e}")
-                return
+    async def judge_node(node):
+        try:
+            # CHANGE 6: judge_move must now use AWAIT and info_handler REMOVED
+            judgment = await judge_move(boards[node], node.move, engine, time_per_move)
 
-            node = prev_node
+            # Record the delta, to be referenced in the second pass
+            node.comment = judgment
 
-        # Calculate the average centipawn loss (ACPL) for each player
-        game = add_acpl(game, root_node)
+            # Print some debugging info
+            debug_print(node, judgment)
+        except chess.engine.EngineError as e:
+            # Log the error cleanly in your own application.
+            move_uci = node.move.uci()
+            board_fen = boards[node].fen()
+            logger.warning(f"EngineError for move {move_uci} on FEN {board_fen}. Error: {e}")
+
+            # You can decide here whether to skip the move (as done with 'pass'),
+            # or assign a default 'judgment'.
+            node.comment = "Skipped due to engine error."
+
+    # The moves after root_node, collected once for both passes. They are kept in
+    # last-to-first order, the order in which the annotations have always been added
+    nodes = list(root_node.mainline())
+    nodes.reverse()
+
+    # The moves are judged independently of each other, so with an EnginePool
+    # of several engines they are analysed concurrently
+    tasks = [asyncio.ensure_future(judge_node(node)) for node in nodes]
+    try:
+        await asyncio.gather(*tasks)
     except Exception as e:
-        print(f"Fatal error during analysis: {e}")
+        # Catch other unexpected errors that do not originate from the engine
+        for task in tasks:
+            task.cancel()
+        logger.error(f"Unexpected error during analysis: {e}")
         return
 
+    # Count the number of mistakes that will have to be re-analysed later;
+    # the ones pass 1 already settled keep their judgment
+    flagged = [node for node in nodes if needs_annotation(node.comment)]
+    judgments = {node: node.comment for node in flagged if is_settled(node.comment)}
+    flagged = [node for node in flagged if node not in judgments]
+    error_count = len(flagged)
+
+    # Calculate the average centipawn loss (ACPL) for each player
+    game = add_acpl(game, root_node)
+
     ###########################################################################
     # Perform game analysis (Pass 2)
     ###########################################################################
@@ -889,19 +1010,22 @@ async def analyze_game(game, arg_gametime, engine, threads):
                  pass2_budget, time_per_move)
     logger.info("Performing second pass...")
 
-    node = game.end()
-    while not node == root_node:
-        prev_node = node.parent
-
-        judgment = node.comment
+    # Re-judge the flagged moves concurrently, then update the game tree one node at a time
+    tasks = [asyncio.ensure_future(judge_move(boards[node], node.move, engine, time_per_move))
+             for node in flagged]
+    try:
+        judgments.update(zip(flagged, await asyncio.gather(*tasks)))
+    finally:
+        for task in tasks:
+            task.cancel()
 
-        if needs_annotation(judgment):
-            # CHANGE 6: judge_move must now use AWAIT and info_handler REMOVED
-            judgment = await judge_move(prev_node.board(), node.move, engine, time_per_move)
+    for node in nodes:
+        judgment = judgments.get(node)
 
+        if judgment is not None:
             # Verify that the engine still dislikes the played move
             if needs_annotation(judgment):
-                add_annotation(node, judgment)
+                add_annotation(node, judgment, boards[node])
             else:
                 node.comment = None
 
@@ -910,18 +1034,25 @@ async def analyze_game(game, arg_gametime, engine, threads):
         else:
             node.comment = None
 
-        node = prev_node
+    return finish_game(root_node, engine_name)
+
 
+def get_engine_name(engine):
+    """Returns the name the engine identifies itself with (e.g., "Stockfish 17")"""
     # Accessing identification data (.id is a dictionary)
-    engine_id = engine.id
+    return engine.id.get("name", "Not found")
 
-    # Get the primary name (e.g., "Stockfish 17")
-    engine_name = engine_id.get("name", "Not found")
 
-    node.root().comment = engine_name
-    node.root().headers["Annotator"] = engine_name
+def finish_game(root_node, engine_name):
+    """
+    Adds the annotator (engine name) to an analysed game and returns it as
+    reformatted PGN text (see change_nags)
+    """
+    root = root_node.root()
+    root.comment = engine_name
+    root.headers["Annotator"] = engine_name
 
-    return change_nags(node.root())
+    return change_nags(root)
 
 def checkgame(game):
     """
@@ -943,6 +1074,10 @@ def checkgame(game):
         return False
     return True
 
+# Runs of spaces that change_nags collapses to a single space
+MULTI_SPACE_RE = re.compile(r' {2,}')
+
+
 def change_nags(pgn):
     """
     Reformat PGN string to change NAGs (Numeric Annotation Glyphs) and ensure line wrapping.
@@ -956,56 +1091,85 @@ def change_nags(pgn):
     # pgn = pgn.replace("$7 {", "{Good ")
     # pgn = pgn.replace("$9 {", "{Brilliant ")
 
-    # Standardize spaces and split into lines
-    strs = pgn.replace("  ", " ").split("\n")
+    # Re-wrap lines to a maximum of 80 characters, preserving the first line
+    # (usually headers or FEN) and header lines
     res = []
-    # Process the first line (usually headers or FEN)
-    res.append(strs.pop(0))
-
-    # Re-wrap lines to a maximum of 80 characters, preserving header lines
-    for line in strs:
-        if len(line) < 80 or line.startswith("["):
+    for i, line in enumerate(pgn.split("\n")):
+        # Standardize spaces; most lines have no runs of spaces, and those are
+        # passed through without being copied
+        if "  " in line:
+            line = MULTI_SPACE_RE.sub(" ", line)
+        if i == 0 or len(line) < 80 or line.startswith("["):
             res.append(line)
         else:
-            line_strs = line.split(" ")
-            hl = "" # current line buffer
-            for word in line_strs:
-                # Check if the word fits on the current line or if it's a closing bracket
-                if len(hl) + len(word) < 80 or word == "}" or word == ")":
-                    sep = " "
-                    if len(hl) == 0:
-                        sep = ""
-                    hl = hl + sep + word
-                else:
-                    # Current line is full, start a new line
-                    res.append(hl)
-                    hl = word
-            # Append any remaining content in the buffer
-            if len(hl) > 0:
-                res.append(hl)
+            res.extend(_wrap_line(line))
+
+    return "\n".join(res)
+
+
+def _wrap_line(line: str) -> Iterator[str]:
+    """
+    Splits a movetext line at spaces into lines of at most 80 characters. A
+    closing "}" or ")" always stays on the line before it, and a word that is
+    longer than a line by itself gets a line of its own.
+    """
+    start = 0
+    end = len(line)
+    while end - start > 80:
+        # The last space that still fits on this line, or else the end of a first
+        # word that does not fit at all
+        brk = line.rfind(" ", start, start + 81)
+        if brk <= start:
+            brk = line.find(" ", start + 1)
+            if brk == -1:
+                break
+        # Closing brackets are pulled onto the line they close
+        while True:
+            nxt = line.find(" ", brk + 1)
+            word_end = end if nxt == -1 else nxt
+            if line[brk + 1:word_end] not in ("}", ")"):
+                break
+            brk = word_end
+            if nxt == -1:
+                break
+        if brk == end:
+            break
+        yield line[start:brk]
+        start = brk + 1
+    # A trailing space that was left over by the last break is dropped
+    if start < end:
+        yield line[start:]
 
-    pgn = "\n".join(res)
-    return pgn
 
 def start_analysis(pgnfile, engine_path, fine_name_file, add_to_library, gui, save_file=True, num_threads=2):
     """Synchronous wrapper to start asynchronous analysis."""
     # Note: loop closing logic removed as it's generally handled by asyncio.run
+    if _engine_session is not None:
+        return _engine_session.run(start_analysis_async(pgnfile, engine_path, fine_name_file, add_to_library,
+                                                        gui, save_file, num_threads, session=_engine_session))
     return asyncio.run(start_analysis_async(pgnfile, engine_path, fine_name_file, add_to_library, gui, save_file, num_threads))
 
-async def start_analysis_async(pgnfile, engine_path, fine_name_file, add_to_library, gui, save_file=True, num_threads=2):
-    engine = await get_engine(engine_path, num_threads)
+async def start_analysis_async(pgnfile, engine_path, fine_name_file, add_to_library, gui, save_file=True, num_threads=2,
+                               session=None):
+    # With a session the engine stays running for the next analysis (see EngineSession)
+    if session is not None:
+        engine = await session.get(engine_path, num_threads, engine_pool_size(num_threads))
+    else:
+        engine = await get_engine(engine_path, num_threads)
+    engine_name = get_engine_name(engine)
 
     analyzed_game = ""
 
     fine_name_file = os.path.join(gui.default_png_dir, fine_name_file)
+    # Opened on the first game that is added to the library; the ExitStack closes it
+    # however the loop is left
+    library = None
 
-    with open(pgnfile) as pgn:
-        for item in pgn_text_iterator(pgnfile):
-            pgn_io = io.StringIO(item.strip())
-            chess_game = chess.pgn.read_game(pgn_io)
+    with open(pgnfile, encoding='utf-8', errors='replace') as pgn, contextlib.ExitStack() as stack:
+        while (chess_game := chess.pgn.read_game(pgn)) is not None:
             try:
                 analyzed_game = await analyze_game(chess_game, 1,
-                                                   engine, num_threads)
+                                                   engine, num_threads, engine_name=engine_name)
 
             except KeyboardInterrupt:
                 logger.critical("\nReceived KeyboardInterrupt.")
@@ -1015,79 +1179,351 @@ async def start_analysis_async(pgnfile, engine_path, fine_name_file, add_to_libr
                 raise e
             else:
                 if not save_file:
+                    if session is None:
+                        await engine.quit()
                     return analyzed_game
 
-                new_filename = pgnfile[:-4] + "-annotated.pgn"
+                new_filename = os.path.splitext(pgnfile)[0] + "-annotated.pgn"
                 annotated_content = str(analyzed_game)
 
                 # Write to the files
                 if not add_to_library:
                     # File 1: annotated_game.pgn
                     with open(os.path.join(gui.preferences.preferences["default_png_dir"], new_filename), 'w') as file1:
-                        file1.writelines(annotated_content)
+                        file1.write(annotated_content)
                     # File 2: fine_name_file
                     with open(fine_name_file, 'w') as file2:
-                        file2.writelines(annotated_content)
+                        file2.write(annotated_content)
 
                 if add_to_library:
                     # Append to library.pgn
-                    with open(os.path.join(gui.default_png_dir, "library.pgn"), 'a') as file3:
-                        file3.writelines('\n\n' + annotated_content)
+                    if library is None:
+                        library = stack.enter_context(open(os.path.join(gui.default_png_dir, "library.pgn"), 'a'))
+                    library.write('\n\n' + annotated_content)
 
     # Clean up (Optional but Recommended)
     # The original cleanup logic was flawed because `loop` was not defined.
     # Await `engine.quit()` is the essential cleanup.
-    engine.quit()
+    if session is None:
+        await engine.quit()
 
     return analyzed_game
 
-def pgn_text_iterator(filepath: str) -> Iterator[str]:
+def _advise_sequential(mm: mmap.mmap):
+    """
+    Tells the kernel a mapping will be read front to back, so it reads ahead
+    aggressively; this is what makes a cold scan of a large PGN file fast.
+    """
+    if hasattr(mmap, 'MADV_SEQUENTIAL'): # Not available on Windows
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+
+
+# Values python-chess uses for missing Seven Tag Roster headers
+PGN_TAG_DEFAULTS = {
+    "Event": "?",
+    "Site": "?",
+    "Date": "????.??.??",
+    "Round": "?",
+    "White": "?",
+    "Black": "?",
+    "Result": "*",
+}
+# Patterns used to scan the raw PGN bytes for games and their header tags
+GAME_START_RE = re.compile(rb'^\[Event ', re.MULTILINE)
+HEADER_RE = re.compile(rb'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]', re.MULTILINE)
+HEADER_END_RE = re.compile(rb'\n\r?\n')
+
+
+def _read_headers(mm, start: int, end: int) -> Dict[str, str] | None:
+    """
+    Extracts the header tags of the game that occupies mm[start:end].
+    Only the tag section (up to the first blank line) is scanned.
+    Returns None if the range contains no tags at all.
+    """
+    header_end = HEADER_END_RE.search(mm, start, end)
+    if header_end:
+        end = header_end.start() + 1
+
+    tags = HEADER_RE.findall(mm[start:end])
+    if not tags:
+        return None
+
+    headers = dict(PGN_TAG_DEFAULTS)
+    for tag, value in tags:
+        headers[tag.decode('ascii')] = value.decode('utf-8', 'replace')
+    return headers
+
+
+@functools.lru_cache(maxsize=8)
+def _tags_regex(tags: Tuple[str, ...]) -> re.Pattern:
+    """HEADER_RE specialized to the given tag names (see _read_tags)."""
+    names = b'|'.join(re.escape(tag.encode('ascii')) for tag in tags)
+    return re.compile(rb'^\[(' + names + rb')\s+"((?:[^"\\]|\\.)*)"\s*\]', re.MULTILINE)
+
+
+def _read_tags(mm, start: int, end: int, tags_re: re.Pattern) -> Dict[str, str] | None:
+    """
+    Like _read_headers, but only extracts the tags matched by tags_re (see
+    _tags_regex): the regex fails on the first bytes of any other tag line
+    (ECO, Opening, TimeControl, ...), and those values are never decoded.
+    """
+    header_end = HEADER_END_RE.search(mm, start, end)
+    if header_end:
+        end = header_end.start() + 1
+
+    section = mm[start:end]
+    tags = tags_re.findall(section)
+    if not tags and not HEADER_RE.search(section):
+        return None
+
+    headers = dict(PGN_TAG_DEFAULTS)
+    for tag, value in tags:
+        headers[tag.decode('ascii')] = value.decode('utf-8', 'replace')
+    return headers
+
+
+class GameTable:
     """
-    Reads a large text file and iterates over items (games) that are separated
-    by a line starting with '[Event'.
+    Header values of a list of games, stored column-wise: one list per tag in
+    COLUMNS instead of one dict per game, which keeps the game list of a large
+    PGN archive (millions of games) small in memory.
+    """
+
+    COLUMNS = ("White", "Black", "Result", "Site", "Event", "WhiteElo", "BlackElo", "Date")
+
+    def __init__(self):
+        self.columns: Dict[str, List[str]] = {tag: [] for tag in self.COLUMNS}
+
+    @classmethod
+    def from_rows(cls, rows) -> "GameTable":
+        """Builds a table from dicts {tag: value}; missing tags become ""."""
+        table = cls()
+        for tag, column in table.columns.items():
+            column.extend(row.get(tag, "") for row in rows)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.columns["White"])
+
+    def extend(self, other: "GameTable"):
+        for tag, column in self.columns.items():
+            column += other.columns[tag]
 
-    This function is a generator: it does not read the entire file into memory,
-    which is essential for very large files.
+    def rows(self, tag: str, value: str) -> List[Dict[str, str]]:
+        """Returns the games whose 'tag' equals 'value', as dicts {tag: value}."""
+        indices = [i for i, v in enumerate(self.columns[tag]) if v == value]
+        columns = self.columns.items()
+        return [{tag: column[i] for tag, column in columns} for i in indices]
+
+
+def pgn_chunk_boundaries(filepath: str, nchunks: int) -> List[Tuple[int, int]]:
+    """
+    Splits a PGN file into at most `nchunks` byte ranges of about equal size
+    that each start at an '[Event ' line, so the ranges can be scanned
+    independently (see pgn_headers_iterator).
+    """
+    size = os.path.getsize(filepath)
+    if nchunks <= 1 or size == 0:
+        return [(0, size)]
+
+    bounds = [0]
+    with open(filepath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(1, nchunks):
+                match = GAME_START_RE.search(mm, max(size * i // nchunks, bounds[-1] + 1))
+                if match is None:
+                    break
+                bounds.append(match.start())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def pgn_headers_iterator(filepath: str, start: int = 0, end: int | None = None,
+                         tags: Iterable[str] | None = None) -> Iterator[Dict[str, str]]:
+    """
+    Iterates over the header tags of all games in a PGN file, without parsing
+    the movetext.
+
+    The file is memory-mapped and game boundaries are found by scanning the raw
+    bytes for lines starting with '[Event '; the tags are matched directly on
+    the mapping, so no per-game strings are built for the movetext.
 
     Args:
-        filepath: The path to the PGN-like text file.
+        filepath: The path to the PGN file.
+        start, end: Byte range to scan (default: the whole file); start must be
+            the beginning of a game (see pgn_chunk_boundaries).
+        tags: Only read these tags (default: all); much faster when the games
+            carry many other tags.
 
     Yields:
-        A string containing one complete item (game).
+        A dictionary {tag: value} per game. Missing Seven Tag Roster tags get
+        the same defaults python-chess uses.
     """
-    current_item_lines = []
+    if tags is None:
+        read_headers = _read_headers
+    else:
+        read_headers = functools.partial(_read_tags, tags_re=_tags_regex(tuple(tags)))
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                stripped_line = line.strip()
-
-                # Check if the line indicates the start of a new item
-                if stripped_line.startswith('[Event '):
-                    # If the buffer is not empty, the previous item is complete.
-                    if current_item_lines:
-                        # Combine and yield the buffer
-                        yield "".join(current_item_lines).strip()
-
-                        # Clear buffer and add the new item (the [Event line)
-                        current_item_lines = [line]
-                    else:
-                        # This is the first line of the file
-                        current_item_lines.append(line)
-                else:
-                    # Add the line to the current item
-                    current_item_lines.append(line)
-
-            # After the loop: yield the very last collected item
-            if current_item_lines:
-                yield "".join(current_item_lines).strip()
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                _advise_sequential(mm)
+                if end is None:
+                    end = len(mm)
+                # Skip a UTF-8 byte order mark, so the first tag line starts at column 0
+                game_start = 3 if start == 0 and mm[:3] == b'\xef\xbb\xbf' else start
+
+                for match in GAME_START_RE.finditer(mm, game_start, end):
+                    if match.start() > game_start:
+                        headers = read_headers(mm, game_start, match.start())
+                        if headers is not None:
+                            yield headers
+                    game_start = match.start()
+
+                headers = read_headers(mm, game_start, end)
+                if headers is not None:
+                    yield headers
 
     except FileNotFoundError:
         print(f"Error: File not found at '{filepath}'")
-    except Exception as e:
-        print(f"An unexpected error occurred while reading: {e}")
 
-async def get_engine(enginepath, threads):
+
+class EnginePool:
+    """
+    A set of UCI engine processes that is used like a single engine: every
+    analyse() call runs on an engine that is idle at that moment, so several
+    positions can be analysed concurrently (e.g. with asyncio.gather).
+    """
+
+    def __init__(self, engines: List[chess.engine.UciProtocol]):
+        self.engines = engines
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for engine in engines:
+            self._idle.put_nowait(engine)
+
+    @property
+    def id(self) -> Dict[str, str]:
+        return self.engines[0].id
+
+    async def analyse(self, board: chess.Board, limit: chess.engine.Limit, **kwargs) -> chess.engine.InfoDict:
+        engine = await self._idle.get()
+        try:
+            return await engine.analyse(board, limit, **kwargs)
+        finally:
+            self._idle.put_nowait(engine)
+
+    async def quit(self):
+        await asyncio.gather(*(engine.quit() for engine in self.engines), return_exceptions=True)
+
+
+def engine_pool_size(threads: int) -> int:
+    """
+    Number of engine processes to start: as many as fit on the CPU cores when
+    every engine uses the given number of threads (at least one).
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, threads))
+
+
+def default_engine_threads() -> int:
+    """
+    Default number of engine threads: all CPU cores but one, which is left for
+    the GUI and the analysis loop (at least one).
+    """
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def default_engine_hash(size: int) -> int:
+    """
+    Default transposition table size in MB for each of `size` engines: a
+    quarter of the available memory (at most MAX_ENGINE_HASH_MB), shared by
+    the engines of a pool.
+    """
+    try:
+        available_mb = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        available_mb = 4 * DEFAULT_ENGINE_HASH_MB # No sysconf (Windows): assume a modest machine
+    return max(16, min(MAX_ENGINE_HASH_MB, available_mb // 4) // max(1, size))
+
+
+def clamp_engine_threads(threads: int) -> int:
+    """Limits a requested number of engine threads to the available CPU cores."""
+    return max(1, min(threads, os.cpu_count() or 1))
+
+
+async def get_engine_pool(enginepath, threads, size, hash_mb=None):
+    """Starts `size` engines (see get_engine) and returns them as an EnginePool."""
+    if hash_mb is None:
+        hash_mb = default_engine_hash(size)
+    results = await asyncio.gather(*(get_engine(enginepath, threads, hash_mb) for _ in range(size)),
+                                   return_exceptions=True)
+    engines = [result for result in results if not isinstance(result, BaseException)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # Don't leave the engines that did start running
+        await asyncio.gather(*(engine.quit() for engine in engines), return_exceptions=True)
+        raise errors[0]
+
+    return EnginePool(engines)
+
+
+class EngineSession:
+    """
+    Keeps an engine pool running between annotation runs, so a long-lived
+    worker process pays the engine start-up (NNUE load, hash allocation) once
+    instead of for every file. The pool is bound to the event loop it was
+    started on, so the session owns that loop and runs everything on it.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.key = None
+        self.pool = None
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    async def get(self, enginepath, threads, size, hash_mb=None):
+        """Returns the running pool, (re)starting it if another engine setup is asked for."""
+        key = (enginepath, threads, size, hash_mb)
+        if self.pool is not None and self.key != key:
+            await self.close()
+        if self.pool is None:
+            self.pool = await get_engine_pool(enginepath, threads, size, hash_mb)
+            self.key = key
+        return self.pool
+
+    async def close(self):
+        if self.pool is not None:
+            pool, self.pool, self.key = self.pool, None, None
+            await pool.quit()
+
+
+# Set by start_engine_session() in processes that run several annotations
+_engine_session: EngineSession | None = None
+
+
+def start_engine_session():
+    """
+    Makes run_annotate keep its engines running for the next call in this
+    process. Meant as (part of) the initializer of a worker process; the
+    engines are quit when the process exits.
+    """
+    global _engine_session
+    if _engine_session is None:
+        _engine_session = EngineSession()
+        atexit.register(_close_engine_session)
+
+
+def _close_engine_session():
+    try:
+        _engine_session.run(_engine_session.close())
+    except Exception:
+        pass # The engines are going away with the process anyway
+
+
+async def get_engine(enginepath, threads, hash_mb=None):
     engine_name = ""
 
     ###########################################################################
@@ -1097,9 +1533,16 @@ async def get_engine(enginepath, threads):
     try:
         # CHANGE 2: Store the transport object globally (Note: `engine_transport` is unused in the return)
         engine_transport, engine = await chess.engine.popen_uci(enginepath)
-        await engine.configure({
-            "Threads": threads
-        })
+        _analysis_cache.clear()
+        options = {"Threads": threads}
+        # The two passes revisit many positions, so a big hash pays off. MultiPV,
+        # Ponder and UCI_AnalyseMode are pinned by python-chess on every analyse().
+        if "Hash" in engine.options:
+            hash_option = engine.options["Hash"]
+            if hash_mb is None:
+                hash_mb = default_engine_hash(1)
+            options["Hash"] = min(max(hash_mb, hash_option.min or 1), hash_option.max or hash_mb)
+        await engine.configure(options)
         # previous_enginepath = enginepath # This variable is not used in this scope
     except FileNotFoundError:
         errormsg = "Engine '{}' was not found. Aborting...".format(enginepath)
@@ -1115,11 +1558,18 @@ async def get_engine(enginepath, threads):
 
 # --- MAIN EXECUTION POINT (Synchronous Wrapper) ---
 
-def run_annotate(pgnfile: str, enginepath: str, gametime: int, threads: int, filter_str: str, outputfile: str):
+def run_annotate(pgnfile: str, enginepath: str, gametime: int, threads: int, filter_str: str, outputfile: str,
+                 hash_mb: int | None = None, min_ply: int = MIN_PLY_FOR_ANALYSIS):
     """Synchronous wrapper to call the async function."""
     # This is the only point where asyncio.run() should be used.
     try:
-        asyncio.run(run_annotate_async(pgnfile, enginepath, gametime, threads, filter_str, outputfile))
+        if _engine_session is not None:
+            _engine_session.run(run_annotate_async(pgnfile, enginepath, gametime, threads, filter_str,
+                                                   outputfile, session=_engine_session, hash_mb=hash_mb,
+                                                   min_ply=min_ply))
+        else:
+            asyncio.run(run_annotate_async(pgnfile, enginepath, gametime, threads, filter_str, outputfile,
+                                           hash_mb=hash_mb, min_ply=min_ply))
         return True # Success
     except KeyboardInterrupt:
         logger.critical("Process aborted by user (KeyboardInterrupt).")
@@ -1133,57 +1583,117 @@ def valid_engine(engine_path):
     else:
         return True
 
-async def run_annotate_async(pgnfile, engine_path, gametime,threads, filter_str, outputfile):
+async def run_annotate_async(pgnfile, engine_path, gametime,threads, filter_str, outputfile, session=None, hash_mb=None,
+                             min_ply=MIN_PLY_FOR_ANALYSIS):
     engine = None
+    output = None
+    completed = False
     try:
         if valid_engine(engine_path):
-            engine = await get_engine(engine_path, threads)
+            if session is not None:
+                engine = await session.get(engine_path, threads, engine_pool_size(threads), hash_mb)
+            else:
+                engine = await get_engine_pool(engine_path, threads, engine_pool_size(threads), hash_mb)
+            engine_name = get_engine_name(engine)
         processed_count = 0
         filtered_count = 0
         new_filename = outputfile
         if outputfile == "":
-            new_filename = pgnfile[:-4] + "-annotated.pgn"
-        # Truncate/create the output file
-        with open(new_filename, 'w') as file1:
-            file1.close()
-
-        for item in pgn_text_iterator(pgnfile):
-            pgn_io = io.StringIO(item.strip())
-            chess_game = chess.pgn.read_game(pgn_io)
-
-            white_player = chess_game.headers.get('White', 'Unknown')
-            black_player = chess_game.headers.get('Black', 'Unknown')
-            event_name = chess_game.headers.get('Event', 'Unknown Event')
-            processed_count += 1
-
-            # APPLYING THE FILTER
-            if filter_str and filter_str != "None" and not matches_filter(chess_game, filter_str):
-                filtered_count += 1
-                continue # Skip to the next game
-
-            # --- PROGRESS MESSAGE ONLY FOR SELECTED GAMES ---
-            print(f"\n--- Game processing (Filter OK): {white_player} vs {black_player} ({event_name}) ---")
+            new_filename = os.path.splitext(pgnfile)[0] + "-annotated.pgn"
+        # Truncate/create the output file, which stays open for the whole run
+        output = open(new_filename, 'w', encoding='utf-8')
+
+        # The games are analysed by one worker per engine in the pool, so the engines
+        # stay busy while a game is in its (sequential) second pass. Finished games
+        # are written in the order of the input file.
+        num_workers = len(engine.engines) if engine else 1
+        games = asyncio.Queue(maxsize=2 * num_workers)
+        finished = {}
+        next_index = 0
+
+        def write_finished():
+            nonlocal next_index
+            while next_index in finished:
+                # Serialize the game once for both the console and the file
+                text = str(finished.pop(next_index))
+                next_index += 1
+                print(text, '\n')
+                output.write(text)
+                # write one empty line to the output
+                output.write('\n\n')
+                # Games take long to analyse: keep the file complete up to the last game
+                output.flush()
+
+        async def read_games():
+            nonlocal processed_count, filtered_count
+            index = 0
+            use_filter = filter_str and filter_str != "None"
+            # read_game streams the games straight from the file
+            with open(pgnfile, encoding='utf-8', errors='replace') as pgn:
+                while True:
+                    if use_filter:
+                        # Filter on the headers first, so the moves of skipped games are never parsed
+                        offset = pgn.tell()
+                        headers = chess.pgn.read_headers(pgn)
+                        if headers is None:
+                            break
+                        processed_count += 1
+                        # Without a Result tag read_game takes the result from the movetext,
+                        # so only the full game can tell whether such a game matches
+                        checked = headers.get("Result", "*") != "*"
+                        if checked and not matches_filter_headers(headers, filter_str):
+                            filtered_count += 1
+                            continue # Skip to the next game
+                        pgn.seek(offset)
+                        chess_game = chess.pgn.read_game(pgn)
+                    else:
+                        checked = True
+                        chess_game = chess.pgn.read_game(pgn)
+                        if chess_game is None:
+                            break
+                        processed_count += 1
+
+                    # APPLYING THE FILTER
+                    if not checked and not matches_filter(chess_game, filter_str):
+                        filtered_count += 1
+                        continue # Skip to the next game
+
+                    await games.put((index, chess_game))
+                    index += 1
+            for _ in range(num_workers):
+                await games.put(None)
+
+        async def analyse_games():
+            while (item := await games.get()) is not None:
+                index, chess_game = item
+                white_player = chess_game.headers.get('White', 'Unknown')
+                black_player = chess_game.headers.get('Black', 'Unknown')
+                event_name = chess_game.headers.get('Event', 'Unknown Event')
+
+                # --- PROGRESS MESSAGE ONLY FOR SELECTED GAMES ---
+                print(f"\n--- Game processing (Filter OK): {white_player} vs {black_player} ({event_name}) ---")
 
-            try:
                 if valid_engine(engine_path):
-                    analyzed_game = await analyze_game(chess_game, gametime,
-                                                       engine, threads)
-            except KeyboardInterrupt:
-                logger.critical("\nReceived KeyboardInterrupt.")
-                raise
-            except Exception as e:
-                logger.critical("\nAn unhandled exception occurred: {}"
-                                 .format(type(e)))
-                raise e
-            else:
-                print(analyzed_game, '\n')
-                with open(new_filename, 'a') as file1:
-                    file1.writelines(str(analyzed_game))
-                    # write one empty line to file1
-                    file1.write('\n\n')
+                    try:
+                        chess_game = await analyze_game(chess_game, gametime,
+                                                        engine, threads, min_ply, engine_name)
+                    except Exception as e:
+                        logger.critical("\nAn unhandled exception occurred: {}"
+                                         .format(type(e)))
+                        raise
+                finished[index] = chess_game
+                write_finished()
+
+        tasks = [asyncio.ensure_future(read_games())]
+        tasks += [asyncio.ensure_future(analyse_games()) for _ in range(num_workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Stop the other workers if one of them failed
+            for task in tasks:
+                task.cancel()
 
-        if valid_engine(engine_path) and engine:
-            await engine.quit()
+        completed = True
 
         if processed_count > 1:
             print(f"\n--- Results ---")
@@ -1200,9 +1710,15 @@ async def run_annotate_async(pgnfile, engine_path, gametime,threads, filter_str,
         logger.critical(errormsg)
         raise
     finally:
-        # Ensure engine is quit even if an error occurs outside the loop
-        if engine and valid_engine(engine_path):
+        if output is not None:
+            output.close()
+        # Quit the engine, unless a session keeps it for the next run. After an error
+        # the session's engine is quit too, so the next run starts with a fresh one.
+        if engine and valid_engine(engine_path) and (session is None or not completed):
             try:
-                await engine.quit()
+                if session is not None:
+                    await session.close()
+                else:
+                    await engine.quit()
             except Exception:
                 pass # Ignore if engine is already closed
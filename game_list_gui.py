@@ -122,7 +122,7 @@ class GameListView:
                 # Original call
                 print(filter_string)
                 print(pgn_output_string)
-                core.run_annotate(self.input_filename, self.engine_name, 1, 8, filter_string, pgn_output_string)
+                core.run_annotate(self.input_filename, self.engine_name, 1, core.default_engine_threads(), filter_string, pgn_output_string)
             except Exception as e:
                 # Update error status (SAFELY via after)
                 self.top.after(0, self._update_status,
@@ -213,7 +213,7 @@ class GameListView:
         # The PGN directory is now composed based on the suffix in the JSON
         pgn_suffix = config_data.get("default_pgn_dir_suffix", "Schaken")
         default_pgn_dir = os.path.join(os.path.expanduser("~"), pgn_suffix)
-        print(f"Default PGN Directory: {default_pgn_dir}")
+        core.logger.debug(f"Default PGN Directory: {default_pgn_dir}")
 
         # The engine options are loaded from the JSON
         # The JSON structure (list of dicts) is converted to the Python structure (list of tuples)
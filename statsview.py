@@ -5,10 +5,16 @@ import tkinter as tk
 from tkinter import ttk
 from typing import List, Dict, Any, Optional
 from game_list_gui import GameListView
+from core import GameTable
+
+# Tcl lambdas (run via 'apply') that insert/reorder all rows of a Treeview in a single
+# Tcl call. The rows are passed as a native Tcl list, so no string quoting is needed.
+_TCL_BULK_INSERT = '{path rows} { foreach {iid values tag} $rows { $path insert {} end -id $iid -values $values -tags [list $tag] } }'
+_TCL_BULK_REORDER = '{path rows} { set index 0; foreach {iid tag} $rows { $path move $iid {} $index; $path item $iid -tags [list $tag]; incr index } }'
 
 
 class PGNStatsView:
-    def __init__(self, master, site_data: List[Dict[str, Any]], event_data: List[Dict[str, Any]], input_filename: str, all_games: List[Dict[str, Any]]):
+    def __init__(self, master, site_data: List[Dict[str, Any]], event_data: List[Dict[str, Any]], input_filename: str, all_games: GameTable):
         self.master = master
         master.title("PGN Analysis Results")
         master.geometry("700x500")
@@ -22,6 +28,10 @@ class PGNStatsView:
         # Current Treeview where the context menu is activated
         self.current_tree: Optional[ttk.Treeview] = None
 
+        # Python-side copy of the row values per Treeview ({iid: (name, count, elo)}),
+        # so sorting does not need a Tcl round-trip per row
+        self._row_values: Dict[str, Dict[str, tuple]] = {}
+
         # 0. Status bar for feedback
         self.status_label = ttk.Label(master, text="Click on a row to copy the name. Right-click for menu.",
                                       anchor=tk.W, background='#CFD8DC', padding=(5, 2))
@@ -111,7 +121,7 @@ class PGNStatsView:
             self._copy_item(self.current_tree)
 
     # --- HELPER FUNCTION FOR PGN READING ---
-    def _pgn_reader(self, input_file_path: str, tag_name: str, tag_value: str, all_games: List[Dict[str, Any]]) -> List[
+    def _pgn_reader(self, input_file_path: str, tag_name: str, tag_value: str, all_games: GameTable) -> List[
         Dict[str, Any]]:
         """
         Reads a PGN file and filters by a Site or Event.
@@ -125,25 +135,8 @@ class PGNStatsView:
             A list of game data (White, Black, Result, Date, Site, Event).
         """
 
-        # Filter the data
-        filtered_games = [game for game in all_games if game.get(tag_name) == tag_value]
-
-        # Format the output to return only the necessary meta-information
-        output = []
-        for game in filtered_games:
-            # Ensure all necessary tags are present for the GameListView
-            output.append({
-                "White": game["White"],
-                "Black": game["Black"],
-                "Result": game["Result"],
-                "Site": game["Site"],
-                "Event": game["Event"],
-                "WhiteElo": game["WhiteElo"],
-                "BlackElo": game["BlackElo"],
-                "Date": game["Date"]
-            })
-
-        return output
+        # Filter the data; the rows have all the tags the GameListView needs
+        return all_games.rows(tag_name, tag_value)
     def _display_selected_games(self):
         """Function called by the 'Show Games' menu command."""
 
@@ -223,9 +216,18 @@ class PGNStatsView:
         for item in tree.get_children():
             tree.delete(item)
 
+        row_values = {}
+        rows = []
         for i, item in enumerate(data):
             tag = 'oddrow' if i % 2 != 0 else 'evenrow'
-            tree.insert("", tk.END, values=(item["Naam"], item["Count"], item["AvgElo"]), tags=(tag,))
+            iid = str(i)
+            values = (item["Naam"], item["Count"], item["AvgElo"])
+            row_values[iid] = values
+            rows.extend((iid, values, tag))
+        self._row_values[str(tree)] = row_values
+
+        # One Tcl call for all rows instead of a tree.insert() round-trip per row
+        tree.tk.call('apply', _TCL_BULK_INSERT, str(tree), tuple(rows))
 
         tree.tag_configure('evenrow', background='#F5F5F5')
         tree.tag_configure('oddrow', background='#FFFFFF')
@@ -249,17 +251,20 @@ class PGNStatsView:
     def _sort_treeview(self, tree: ttk.Treeview, col_key: str, reverse: bool):
         """Sorts the rows in the Treeview based on the column and direction."""
 
-        data = [(tree.set(child, col_key), child) for child in tree.get_children('')]
+        col_idx = {'Naam': 0, 'Count': 1, 'AvgElo': 2}[col_key]
+        row_values = self._row_values[str(tree)]
+        data = [(row_values[child][col_idx], child) for child in tree.get_children('')]
 
         if col_key in ('Count', 'AvgElo'):
             data.sort(key=lambda t: int(t[0]), reverse=reverse)
         else:
-            data.sort(key=lambda t: t[0].lower(), reverse=reverse)
+            data.sort(key=lambda t: str(t[0]).lower(), reverse=reverse)
 
+        rows = []
         for index, (val, child) in enumerate(data):
-            tree.move(child, '', index)
             tag = 'oddrow' if index % 2 != 0 else 'evenrow'
-            tree.item(child, tags=(tag,))
+            rows.extend((child, tag))
+        tree.tk.call('apply', _TCL_BULK_REORDER, str(tree), tuple(rows))
 
     def _update_header_indicator(self, tree: ttk.Treeview, col_key: str, reverse: bool):
         """Updates the column headers to show the sorting direction."""
@@ -305,5 +310,6 @@ if __name__ == '__main__':
 
 
     root = tk.Tk()
-    app = PGNStatsView(root, SITE_DATA_MOCK, EVENT_DATA_MOCK, input_filename="my_games.pgn", all_games=ALL_GAMES_MOCK)
+    app = PGNStatsView(root, SITE_DATA_MOCK, EVENT_DATA_MOCK, input_filename="my_games.pgn",
+                       all_games=GameTable.from_rows(ALL_GAMES_MOCK))
     root.mainloop()
\ No newline at end of file